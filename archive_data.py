@@ -0,0 +1,38 @@
+import argparse
+import datetime
+import os
+import sys
+
+# Command line entry point for the archiver in health.py, for running it from
+# cron or a scheduled task, e.g.
+#   python archive_data.py --before 2024-01-01 --db hospital.db
+def main():
+    parser = argparse.ArgumentParser(description="Move old calorie, fitness and billing records into yearly archive files.")
+    parser.add_argument("--before", type=datetime.date.fromisoformat, default=None,
+                        help="archive records dated before this day (defaults to HOSPITAL_ARCHIVE_AFTER_DAYS ago)")
+    parser.add_argument("--table", action="append", default=None, help="Calories, PhysicalFitness or Billing (repeatable)")
+    parser.add_argument("--db", default=None, help="database file (defaults to HOSPITAL_DB or hospital.db)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows moved per transaction")
+    args = parser.parse_args()
+
+    # health.py reads the database location when it is imported
+    if args.db:
+        os.environ["HOSPITAL_DB"] = args.db
+    import health
+
+    for table in args.table or []:
+        if table not in health.ARCHIVE_TABLES:
+            parser.error(f"--table must be one of {', '.join(health.ARCHIVE_TABLES)}")
+
+    def show_progress(table, year, moved):
+        print(f"\r{table} {year}: {moved:,} rows archived", end="", file=sys.stderr)
+
+    cutoff = args.before or health.archive_cutoff()
+    report = health.archive_rows(cutoff, args.table, args.batch_size, progress=show_progress)
+    print(file=sys.stderr)
+    print(f"Archived records before {cutoff}: " + ", ".join(f"{count:,} {table}" for table, count in report.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
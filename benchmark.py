@@ -0,0 +1,311 @@
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Benchmark harness for the database logic behind the add_*/view_* pages, run
+# without a browser against a synthetic hospital.db-compatible database, e.g.
+#   python benchmark.py --rows 100000 --out results.json --compare baseline.json
+
+FIRST_NAMES = ["Aarav", "Ananya", "Rohit", "Sakshi", "Vinita", "Arjun", "Meera", "Kabir", "Ishani", "Neel"]
+LAST_NAMES = ["Singh", "Sharma", "Mitra", "Jha", "Dey", "Kurien", "Gandhi", "Narayan", "Ojha", "Biyani"]
+SPECIALTIES = ["Cardiology", "Dermatology", "Nutrition", "Orthopedics", "Pediatrics", "General Medicine"]
+SYMPTOMS = ["fever", "dry cough", "red rashes", "stomach ache", "headache", "asthma", "joint pain", "fatigue"]
+DIAGNOSES = ["viral fever", "asthma", "eczema", "gastritis", "migraine", "arthritis", "anemia", "healthy"]
+MEDICINES = ["paracetamol", "budesonide", "ketoconazole", "acetaminophen", "clarithromycin", "ibuprofen"]
+EXERCISES = ["Aerobic", "Yoga", "Running", "Cycling", "Swimming", "Strength"]
+PAYMENTS = ["Cash", "Credit Card", "Debit Card", "Online"]
+TESTS = ["Blood test", "Urine test", "HBA1C test", "BP test", "Lipid profile"]
+CHUNK = 50_000
+WRITERS = 16
+
+
+def random_date(rng, start=datetime.date(2020, 1, 1), days=5 * 365):
+    return (start + datetime.timedelta(days=rng.randrange(days))).isoformat()
+
+
+def person_name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+# A 30-minute appointment on a random working half-hour
+def appointment_row(rng, patient_id, doctor_id):
+    date, time = random_date(rng), f"{rng.randrange(9, 17):02d}:{rng.choice(['00', '30'])}"
+    ends = datetime.datetime.fromisoformat(f"{date} {time}") + datetime.timedelta(minutes=30)
+    return patient_id, doctor_id, date, time, "follow-up", f"{date} {time}", ends.strftime("%Y-%m-%d %H:%M")
+
+
+# Row generators for every table as (table, columns, row factory). Factories get
+# the RNG and the patient/doctor/prescription counts so every reference is valid.
+def table_generators(rows):
+    patients = rows
+    doctors = max(rows // 100, 10)
+    return [
+        ("Patients", ["Name", "Age", "Gender", "Address", "Phone"], patients,
+         lambda rng, n: (person_name(rng), rng.randrange(1, 95), rng.choice(["Male", "Female", "Other"]),
+                         f"{rng.randrange(1, 999)} Main Road", f"9{rng.randrange(10 ** 8, 10 ** 9)}")),
+        ("Doctors", ["Name", "Specialty"], doctors,
+         lambda rng, n: ("Dr. " + person_name(rng), rng.choice(SPECIALTIES))),
+        ("Prescription", ["PatientID", "DoctorID", "MedicineName"], rows,
+         lambda rng, n: (rng.randrange(1, patients + 1), rng.randrange(1, doctors + 1), rng.choice(MEDICINES))),
+        ("Dispensary", ["PatientID", "DoctorID", "PrescriptionID", "Medicine", "Quantity"], rows,
+         lambda rng, n: (rng.randrange(1, patients + 1), rng.randrange(1, doctors + 1), rng.randrange(1, rows + 1),
+                         rng.choice(MEDICINES), rng.randrange(1, 5))),
+        ("Calories", ["PatientID", "DoctorID", "TotalCalories", "Date"], rows,
+         lambda rng, n: (rng.randrange(1, patients + 1), rng.randrange(1, doctors + 1),
+                         rng.randrange(800, 3500), random_date(rng))),
+        ("Symptoms", ["PatientID", "Symptoms", "Duration", "Allergy"], rows,
+         lambda rng, n: (rng.randrange(1, patients + 1), ", ".join(rng.sample(SYMPTOMS, 2)),
+                         f"{rng.randrange(1, 14)} days", rng.choice(["none", "dust", "pollen", "penicillin"]))),
+        ("Diagnosis", ["PatientID", "Result"], rows,
+         lambda rng, n: (rng.randrange(1, patients + 1), rng.choice(DIAGNOSES))),
+        ("PhysicalFitness", ["PatientID", "TypeOfExercise", "Duration", "Benefit"], rows,
+         lambda rng, n: (rng.randrange(1, patients + 1), rng.choice(EXERCISES), f"{rng.randrange(10, 90)} min",
+                         "better stamina and blood circulation")),
+        ("HealthyDiets", ["PatientID", "DoctorID", "DietDescription"], rows,
+         lambda rng, n: (rng.randrange(1, patients + 1), rng.randrange(1, doctors + 1),
+                         "low sugar, high fibre diet with " + rng.choice(["oats", "lentils", "greens", "fruit"]))),
+        ("Billing", ["ModeOfPayment", "PatientID", "ReceiptNo"], rows,
+         lambda rng, n: (rng.choice(PAYMENTS), rng.randrange(1, patients + 1), f"R{n:09d}")),
+        ("LabTests", ["TypeOfTest", "DateOfTest"], rows,
+         lambda rng, n: (rng.choice(TESTS), random_date(rng))),
+        ("Appointments", ["PatientID", "DoctorID", "Date", "Time", "Description", "StartsAt", "EndsAt"], rows,
+         lambda rng, n: appointment_row(rng, rng.randrange(1, patients + 1), rng.randrange(1, doctors + 1))),
+    ]
+
+
+# Fill the database with `rows` rows per table (and rows / 100 doctors) in
+# batched transactions through the same connection pool the app uses
+def populate(health, rows, seed):
+    rng = random.Random(seed)
+    timings = {}
+    for table, columns, count, make_row in table_generators(rows):
+        started = time.perf_counter()
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        for start in range(0, count, CHUNK):
+            batch = [make_row(rng, n) for n in range(start, min(start + CHUNK, count))]
+            with health.transaction() as conn:
+                conn.executemany(sql, batch)
+        seconds = time.perf_counter() - started
+        timings[table] = {"rows": count, "seconds": seconds, "rows_per_second": count / seconds if seconds else 0}
+        print(f"  {table}: {count:,} rows in {seconds:.1f}s", file=sys.stderr)
+    return timings
+
+
+# Time `func` `repeat` times, then run it once more under tracemalloc for its
+# peak Python memory
+def measure(func, repeat):
+    latencies = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - started)
+    tracemalloc.start()
+    func(repeat)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "runs": repeat,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "mean_ms": total / repeat * 1000,
+        "ops_per_second": repeat / total if total else 0,
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+# The workloads: view pages (first, deep, sorted, filtered), inserts behind the
+# add_* forms, picker lookups and the other read paths of the app
+def workloads(health, rows):
+    rng = random.Random(1)
+    doctors = max(rows // 100, 10)
+    middle = rows // 2
+
+    def view(name, **kwargs):
+        return lambda i: health.fetch_page(name, **kwargs)
+
+    cases = {}
+    for name in health.VIEWS:
+        cases[f"view:{name}:first_page"] = view(name)
+        cases[f"view:{name}:sorted_page"] = view(name, sort=health.VIEWS[name]["columns"][-1][0], descending=True)
+    cases["view:Patients:deep_page"] = view("Patients", after=(middle, middle))
+    cases["view:Calories:deep_page"] = view("Calories", after=(middle, middle))
+    cases["view:Patients:filtered_page"] = view("Patients", filters={"Name": "Singh"})
+    cases["view:Calories:filtered_page"] = view("Calories", filters={"Date": "2023-06"})
+
+    patient = lambda: rng.randrange(1, rows + 1)
+    doctor = lambda: rng.randrange(1, doctors + 1)
+    inserts = {
+        "Patients": lambda: {"Name": person_name(rng), "Age": 40, "Gender": "Female", "Address": "x", "Phone": "9"},
+        "Doctors": lambda: {"Name": "Dr. " + person_name(rng), "Specialty": rng.choice(SPECIALTIES)},
+        "HealthyDiets": lambda: {"PatientID": patient(), "DoctorID": doctor(), "DietDescription": "more greens"},
+        "Calories": lambda: {"PatientID": patient(), "DoctorID": doctor(), "TotalCalories": 2000,
+                             "Date": random_date(rng)},
+        "Symptoms": lambda: {"PatientID": patient(), "Symptoms": "fever", "Duration": "2 days", "Allergy": "none"},
+        "Diagnosis": lambda: {"PatientID": patient(), "Result": "viral fever"},
+        "PhysicalFitness": lambda: {"PatientID": patient(), "TypeOfExercise": "Yoga", "Duration": "30 min",
+                                    "Benefit": "flexibility"},
+        "Dispensary": lambda: {"PatientID": patient(), "DoctorID": doctor(), "PrescriptionID": patient(),
+                               "Medicine": "paracetamol", "Quantity": 2},
+        "Prescription": lambda: {"PatientID": patient(), "DoctorID": doctor(), "MedicineName": "paracetamol"},
+        "Billing": lambda: {"ModeOfPayment": "Cash", "PatientID": patient(), "ReceiptNo": "B1"},
+        "LabTests": lambda: {"TypeOfTest": "BP test", "DateOfTest": random_date(rng)},
+    }
+    for table, values in inserts.items():
+        cases[f"add:{table}"] = lambda i, table=table, values=values: health.insert_row(table, values())
+    # WRITERS sessions saving a calorie entry at the same moment
+    writers = concurrent.futures.ThreadPoolExecutor(WRITERS)
+    cases[f"add:Calories:{WRITERS}_concurrent"] = lambda i: list(writers.map(
+        lambda values: health.insert_row("Calories", values), [inserts["Calories"]() for _ in range(WRITERS)]))
+
+    lookups = health.get_lookups()
+    cases["lookup:patients:prefix"] = lambda i: lookups.search("patients", rng.choice(FIRST_NAMES)[:3])
+    cases["stock:lookup"] = lambda i: health.stock_level(rng.choice(MEDICINES))
+    cases["stock:low_stock"] = lambda i: health.low_stock()
+    # Conflicts are expected on a busy calendar; they are part of the work measured
+    def book(i):
+        try:
+            health.book_appointment(patient(), doctor(), datetime.datetime.fromisoformat(
+                f"{random_date(rng)} {rng.randrange(9, 17):02d}:00"))
+        except ValueError:
+            pass
+    cases["appointments:book"] = book
+    cases["appointments:free_slots"] = lambda i: health.free_slots(datetime.date.fromisoformat(random_date(rng)))
+    def calendar_week(i):
+        start = datetime.datetime.fromisoformat(random_date(rng))
+        return health.appointments_between(start, start + datetime.timedelta(days=7))
+    cases["appointments:calendar_week"] = calendar_week
+    # Synthetic patients are inserted without blocking keys; compute them once up front
+    health.refresh_patient_keys()
+    cases["dedupe:insert_check"] = lambda i: health.possible_duplicates(person_name(rng), 40, "Female",
+                                                                        f"9{rng.randrange(10 ** 8, 10 ** 9)}")
+    cases["dedupe:report"] = lambda i: health.duplicate_report()
+    today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    cases["dashboard:counters"] = lambda i: (health.dashboard_counters.clear(), health.dashboard_counters(today))
+    cases["dashboard:cached"] = lambda i: health.dashboard_counters(today)
+    # What the dashboard would cost without the Counters table
+    cases["dashboard:full_counts"] = lambda i: [health.run_query(sql, params) for sql, params in [
+        ("SELECT COUNT(*) FROM Patients", ()), ("SELECT COUNT(*) FROM Doctors", ()),
+        ("SELECT COUNT(*) FROM Prescription WHERE date(RecordedAt) = ?", (today,)),
+        ("SELECT COUNT(*) FROM Dispensary WHERE date(RecordedAt) = ?", (today,)),
+        ("SELECT ModeOfPayment, COUNT(*) FROM Billing GROUP BY ModeOfPayment", ()),
+        ("SELECT TypeOfTest, COUNT(*) FROM LabTests GROUP BY TypeOfTest", ())]]
+    cases["search:notes"] = lambda i: health.search_notes("asthma")
+    cases["timeline:patient"] = lambda i: health.fetch_timeline(patient())
+    cases["frame:calorie_daily_all"] = lambda i: health.calorie_daily_frame("2020-01-01", "2024-12-31")
+    cases["frame:patients_all"] = lambda i: health.query_frame("SELECT * FROM Patients")
+    cases["trends:population"] = lambda i: health.calorie_population_frame("2020-01-01", "2024-12-31")
+    cases["trends:patient"] = lambda i: health.add_calorie_trends(
+        health.calorie_daily_frame("2020-01-01", "2024-12-31", patient()))
+    # Archival moves rows, so it runs last: every run archives the next week of
+    # 2020 calorie entries, then a view reads a range from the archive files and
+    # one that only needs the hot database
+    def archive_week(i):
+        return health.archive_rows(datetime.date(2020, 1, 1) + datetime.timedelta(days=7 * (i + 1)), ["Calories"])
+    cases["archive:calories_week"] = archive_week
+    cases["view:Calories:archived_range"] = view("Calories", date_range=(datetime.date(2020, 1, 1),
+                                                                         datetime.date(2020, 3, 31)))
+    cases["view:Calories:hot_range"] = view("Calories", date_range=(datetime.date(2024, 1, 1),
+                                                                    datetime.date(2024, 3, 31)))
+    return cases
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# Print p50 changes against an earlier results file
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\n{'benchmark':45} {'before p50':>12} {'after p50':>12} {'change':>8}")
+    for name, result in results.items():
+        if name in baseline:
+            before, after = baseline[name]["p50_ms"], result["p50_ms"]
+            change = (after - before) / before * 100 if before else 0
+            print(f"{name:45} {before:10.3f}ms {after:10.3f}ms {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hospital database logic on synthetic data.")
+    parser.add_argument("--rows", type=int, default=10_000, help="rows per table (doctors get rows / 100)")
+    parser.add_argument("--db", default=None, help="database file to create (defaults to a temporary file)")
+    parser.add_argument("--reuse", action="store_true", help="benchmark an already populated --db as is")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--out", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "hospital.db")
+    if not args.reuse and os.path.exists(path):
+        parser.error(f"{path} already exists; pass --reuse to benchmark it as is")
+    # health.py reads the database location when it is imported
+    os.environ["HOSPITAL_DB"] = path
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import health
+
+    results = {}
+    # Schema setup on an empty database, then the per-process cost on an up-to-date one
+    with tempfile.TemporaryDirectory() as scratch:
+        def fresh_migrate(i):
+            conn = sqlite3.connect(os.path.join(scratch, f"schema{i}.db"), isolation_level=None)
+            health.migrate(conn)
+            conn.close()
+        results["create_tables:fresh"] = measure(fresh_migrate, min(args.repeat, 10))
+
+    population = None
+    if not args.reuse:
+        print(f"Populating {path} with {args.rows:,} rows per table", file=sys.stderr)
+        health.get_pool()
+        population = populate(health, args.rows, args.seed)
+    with health.get_pool().connection() as conn:
+        results["create_tables:up_to_date"] = measure(lambda i: health.migrate(conn), args.repeat)
+        rows = conn.execute("SELECT COALESCE(MAX(PatientID), 0) FROM Patients").fetchone()[0]
+
+    for name, func in workloads(health, rows).items():
+        if args.filter in name:
+            results[name] = measure(func, args.repeat)
+            print(f"  {name:45} p50 {results[name]['p50_ms']:9.3f}ms  p95 {results[name]['p95_ms']:9.3f}ms",
+                  file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "rows_per_table": rows,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "population": population,
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.out}", file=sys.stderr)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
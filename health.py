@@ -1,13 +1,397 @@
 import streamlit as st
-import pandas as pd
 import sqlite3
+import os
+import sys
+import queue
+import threading
+import time
+import bisect
+import collections
+import difflib
+import functools
+import itertools
+import datetime
+import io
+import csv
+import json
+import tempfile
+import concurrent.futures
+from contextlib import contextmanager
 
-# Create or connect to a SQLite database
-conn = sqlite3.connect('hospital.db', check_same_thread=False)  # Added for Streamlit compatibility
-c = conn.cursor()
+# Start of this script run, for the rerun timing in the performance panel
+SCRIPT_STARTED = time.perf_counter()
 
-# Create tables in the database if they don't already exist
-def create_tables():
+# Location of the SQLite database (override with HOSPITAL_DB for tools and tests)
+DB_PATH = os.environ.get("HOSPITAL_DB", "hospital.db")
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+BEGIN_RETRIES = 5
+
+# Pool of SQLite connections shared by every Streamlit session. A session checks
+# a connection out for one query or transaction and hands it back afterwards, so
+# no two threads ever use the same connection or cursor at the same time.
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # isolation_level=None: transactions are opened explicitly by transaction()
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False, isolation_level=None)
+        # WAL lets readers keep reading while a writer commits
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across application crashes in WAL mode and skips an fsync per commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-16000")  # 16 MB page cache per connection
+        conn.execute("PRAGMA mmap_size=268435456")  # map up to 256 MB of the file
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                # Pool exhausted: wait for another session to give a connection back
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+# One pool per database file for the whole process, kept across script reruns
+@st.cache_resource
+def get_pool(path=DB_PATH):
+    pool = ConnectionPool(path)
+    with pool.connection() as conn:
+        migrate(conn)
+    return pool
+
+QUERY_LOG_SIZE = 500
+QUERY_STATS_LIMIT = 1000
+SLOW_QUERY_MS = float(os.environ.get("HOSPITAL_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.environ.get("HOSPITAL_SLOW_QUERY_LOG")  # JSONL file, off when unset
+
+# In-memory record of executed SQL: a ring buffer of the most recent queries and
+# running totals per statement. Statements slower than SLOW_QUERY_MS are also
+# appended to SLOW_QUERY_LOG when it is set (without their parameters, which can
+# contain patient data).
+class QueryLog:
+    def __init__(self, size=QUERY_LOG_SIZE):
+        self._lock = threading.Lock()
+        self.recent = collections.deque(maxlen=size)
+        self.stats = {}
+
+    def record(self, sql, params, seconds, rows, caller, error=None):
+        statement = " ".join(sql.split())
+        entry = {"time": time.time(), "sql": statement, "ms": seconds * 1000, "rows": rows,
+                 "caller": caller, "error": error}
+        with self._lock:
+            self.recent.append(entry)
+            stats = self.stats.get(statement)
+            if stats is None and len(self.stats) < QUERY_STATS_LIMIT:
+                stats = self.stats[statement] = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                                 "rows": 0, "callers": set(), "params": params}
+            if stats is not None:
+                stats["calls"] += 1
+                stats["errors"] += error is not None
+                stats["total_ms"] += entry["ms"]
+                stats["max_ms"] = max(stats["max_ms"], entry["ms"])
+                stats["rows"] += rows
+                stats["callers"].add(caller)
+                stats["params"] = params
+            if SLOW_QUERY_LOG and entry["ms"] >= SLOW_QUERY_MS:
+                with open(SLOW_QUERY_LOG, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    # Statements ordered by total time spent in them
+    def top(self, limit=20):
+        with self._lock:
+            items = sorted(self.stats.items(), key=lambda item: item[1]["total_ms"], reverse=True)[:limit]
+            return [dict(stats, sql=sql, callers=sorted(stats["callers"])) for sql, stats in items]
+
+    def reset(self):
+        with self._lock:
+            self.recent.clear()
+            self.stats.clear()
+
+@st.cache_resource
+def get_query_log():
+    return QueryLog()
+
+# Name of the page function (add_*, view_*, *_page) that issued the current
+# query, or the nearest caller outside the database helpers
+def query_caller():
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        name = frame.f_code.co_name
+        if name not in DB_HELPERS:
+            if name.startswith(("add_", "view_")) or name.endswith("_page"):
+                return name
+            fallback = fallback or name
+        frame = frame.f_back
+    return fallback
+
+# Record a finished statement; `started` is its time.perf_counter() start
+def record_query(sql, params, started, rows=0, error=None):
+    get_query_log().record(sql, params, time.perf_counter() - started, rows, query_caller(),
+                           None if error is None else f"{type(error).__name__}: {error}")
+
+# Run a read-only query and return all rows. `archives` ({alias: file name})
+# are attached to the connection first, for queries that read archived rows.
+def run_query(sql, params=(), archives=None):
+    started = time.perf_counter()
+    try:
+        with get_pool().connection() as conn:
+            if archives:
+                attach_archives(conn, archives)
+            rows = conn.execute(sql, params).fetchall()
+    except Exception as e:
+        record_query(sql, params, started, error=e)
+        raise
+    record_query(sql, params, started, len(rows))
+    return rows
+
+FRAME_BATCH_SIZE = 10_000
+# Low-cardinality columns loaded as categoricals wherever a frame has them
+CATEGORY_COLUMNS = {"Gender", "Specialty", "ModeOfPayment", "TypeOfTest", "Status", "Kind", "Source"}
+
+# One column of a batch of rows as an Arrow array. SQLite lets a column mix
+# types; such a batch is kept as strings.
+def column_array(values):
+    import pyarrow as pa
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if value is None else str(value) for value in values], pa.string())
+
+# Common type of one column's per-batch Arrow types: all-NULL batches take the
+# others' type, integers and floats become floats, and any other mix becomes strings
+def common_type(types):
+    import pyarrow as pa
+    types = {t for t in types if not pa.types.is_null(t)}
+    if len(types) > 1:
+        numeric = all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types)
+        types = {pa.float64() if numeric else pa.string()}
+    return types.pop() if types else pa.null()
+
+# Join one column's per-batch arrays, cast to their common type
+def join_column(arrays):
+    import pyarrow as pa
+    target = common_type(array.type for array in arrays)
+    return pa.chunked_array([array.cast(target) for array in arrays], target)
+
+# Build a DataFrame column by column from batches of row tuples. Each batch is
+# turned into typed Arrow columns as soon as it arrives, so only one batch of
+# tuples is alive at a time, and the columns in CATEGORY_COLUMNS are dictionary
+# encoded into pandas categoricals.
+def frame_from_batches(names, batches, categories=CATEGORY_COLUMNS):
+    import pyarrow as pa
+    chunks = [[] for _ in names]
+    for rows in batches:
+        for arrays, values in zip(chunks, zip(*rows)):
+            arrays.append(column_array(values))
+    columns = []
+    for name, arrays in zip(names, chunks):
+        column = join_column(arrays)
+        if name in categories and not pa.types.is_null(column.type):
+            column = column.combine_chunks().dictionary_encode()
+        columns.append(column)
+    return pa.Table.from_arrays(columns, names=names).to_pandas()
+
+# Run a read-only query straight into a DataFrame, fetching FRAME_BATCH_SIZE
+# rows at a time. Column names are the query's own (use AS for display names).
+def query_frame(sql, params=(), categories=CATEGORY_COLUMNS, batch_size=FRAME_BATCH_SIZE):
+    started, count = time.perf_counter(), 0
+    try:
+        with get_pool().connection() as conn:
+            cursor = conn.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+
+            def batches():
+                nonlocal count
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    yield rows
+
+            frame = frame_from_batches(names, batches(), categories)
+    except Exception as e:
+        record_query(sql, params, started, count, error=e)
+        raise
+    record_query(sql, params, started, count)
+    return frame
+
+# Query plan of a statement, using sample parameters
+def explain_query(sql, params=()):
+    with get_pool().connection() as conn:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+# Start a write transaction on `conn`. BEGIN IMMEDIATE takes the write lock up
+# front so two writers never deadlock upgrading from a read lock; if another
+# writer holds the lock for longer than the busy timeout we back off and retry a
+# few times.
+def begin_immediate(conn):
+    for attempt in range(BEGIN_RETRIES):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e) or attempt == BEGIN_RETRIES - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+# Open a write transaction on a pooled connection, for tools and maintenance
+# jobs; the app's own writes go through the writer thread below
+@contextmanager
+def transaction():
+    with get_pool().connection() as conn:
+        begin_immediate(conn)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+GROUP_COMMIT_SIZE = 64  # most writes committed together
+# How long the writer waits for more writes after the first one of a batch. Writes
+# that queue up while a commit is in progress always share the next commit, so
+# the default adds no latency to a lone write; raise it for bigger batches.
+GROUP_COMMIT_WAIT_MS = 0
+
+# The single writer. Sessions hand their writes (functions taking a connection)
+# to one background thread with its own connection, which commits whatever has
+# queued up (up to GROUP_COMMIT_SIZE writes) in one transaction. A busy moment then
+# costs one commit instead of one per click, and sessions never wait on each
+# other for SQLite's write lock. Every write runs in its own savepoint, so a
+# failing write is rolled back alone and the rest of its batch still commits.
+# submit() returns a Future that resolves to the write's return value (or
+# raises its error) once the batch is committed to disk.
+class WriteQueue:
+    def __init__(self, pool, batch_size=GROUP_COMMIT_SIZE, wait_ms=GROUP_COMMIT_WAIT_MS):
+        self.batch_size = batch_size
+        self.wait = wait_ms / 1000
+        self._requests = queue.Queue()
+        self._conn = pool._connect()
+        # A commit is the caller's acknowledgement, so make it survive power loss
+        # too; batching keeps the extra fsync to one per group
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._thread = threading.Thread(target=self._run, name="hospital-db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, write):
+        future = concurrent.futures.Future()
+        self._requests.put((write, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.wait
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._requests.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return [(write, future) for write, future in batch if future.set_running_or_notify_cancel()]
+
+    def _commit_batch(self, batch):
+        conn = self._conn
+        outcomes = []
+        begin_immediate(conn)
+        try:
+            for write, future in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    outcomes.append((future, write(conn), None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    outcomes.append((future, None, e))
+                conn.execute("RELEASE write")
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return outcomes
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                outcomes = self._commit_batch(batch)
+            except Exception as e:
+                # Nothing in the batch was committed
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for future, result, error in outcomes:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+# One writer thread per database file for the whole process
+@st.cache_resource
+def get_writer(path=DB_PATH):
+    return WriteQueue(get_pool(path))
+
+# Run `func(conn)` on the writer thread and return its result once committed.
+# `sql`, `params` and `rows` describe the write for the query log.
+def run_write(func, sql=None, params=(), rows=1):
+    started = time.perf_counter()
+    try:
+        result = get_writer().submit(func).result()
+    except Exception as e:
+        if sql:
+            record_query(sql, params, started, error=e)
+        raise
+    if sql:
+        record_query(sql, params, started, rows)
+    return result
+
+# Insert one row given as {column: value} and return its new ID
+def insert_row(table, values):
+    columns = ", ".join(values)
+    placeholders = ", ".join("?" for _ in values)
+    sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+    params = tuple(values.values())
+    return run_write(lambda conn: conn.execute(sql, params).lastrowid, sql, params)
+
+# Helper functions skipped when attributing a query to its caller
+DB_HELPERS = {"run_query", "query_frame", "insert_row", "record_query", "transaction", "run_write", "__exit__",
+              "__enter__", "fetch_page", "iter_view_batches", "counted", "search", "labels", "_refresh"}
+
+# Schema migrations. Each entry upgrades the database by one version; the
+# current version is stored in PRAGMA user_version, so a migration runs once per
+# database and migrate() itself runs once per process from get_pool().
+
+# Version 1: the base tables, including HealthyDiets, Appointments and
+# LabTests.CompounderID which older databases already have
+def migration_1_base_schema(conn):
+    c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS Patients (
                     PatientID INTEGER PRIMARY KEY AUTOINCREMENT,
                     Name TEXT NOT NULL,
@@ -21,7 +405,24 @@ def create_tables():
                     Name TEXT NOT NULL,
                     Specialty TEXT NOT NULL
                 )''')
-    
+    c.execute('''CREATE TABLE IF NOT EXISTS Appointments (
+                    AppointmentID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    PatientID INTEGER,
+                    DoctorID INTEGER,
+                    Date TEXT NOT NULL,
+                    Time TEXT NOT NULL,
+                    Description TEXT,
+                    FOREIGN KEY (PatientID) REFERENCES Patients(PatientID),
+                    FOREIGN KEY (DoctorID) REFERENCES Doctors(DoctorID)
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS HealthyDiets (
+                    DietID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    PatientID INTEGER,
+                    DoctorID INTEGER,
+                    DietDescription TEXT NOT NULL,
+                    FOREIGN KEY (PatientID) REFERENCES Patients(PatientID),
+                    FOREIGN KEY (DoctorID) REFERENCES Doctors(DoctorID)
+                )''')
     c.execute('''CREATE TABLE IF NOT EXISTS Calories (
                     EntryID INTEGER PRIMARY KEY AUTOINCREMENT,
                     PatientID INTEGER,
@@ -45,7 +446,6 @@ def create_tables():
                     Result TEXT NOT NULL,
                     FOREIGN KEY (PatientID) REFERENCES Patients(PatientID)
                 )''')
-    
     c.execute('''CREATE TABLE IF NOT EXISTS PhysicalFitness (
                     FitnessID INTEGER PRIMARY KEY AUTOINCREMENT,
                     PatientID INTEGER,
@@ -82,12 +482,857 @@ def create_tables():
                 )''')
     c.execute('''CREATE TABLE IF NOT EXISTS LabTests (
                     TestID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    CompounderID INTEGER,
                     TypeOfTest TEXT NOT NULL,
                     DateOfTest TEXT NOT NULL
                 )''')
-    conn.commit()
+    # Databases created by earlier versions of this script lack CompounderID
+    lab_columns = [row[1] for row in c.execute("PRAGMA table_info(LabTests)")]
+    if "CompounderID" not in lab_columns:
+        c.execute("ALTER TABLE LabTests ADD COLUMN CompounderID INTEGER")
+
+# Version 2: indexes on every foreign key and date column, so joins and
+# per-patient/per-date lookups use index seeks instead of full table scans
+def migration_2_indexes(conn):
+    c = conn.cursor()
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointments_patient ON Appointments (PatientID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointments_doctor_date ON Appointments (DoctorID, Date, Time)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_healthydiets_patient ON HealthyDiets (PatientID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_healthydiets_doctor ON HealthyDiets (DoctorID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_calories_patient_date ON Calories (PatientID, Date, TotalCalories)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_calories_doctor ON Calories (DoctorID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_calories_date ON Calories (Date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_symptoms_patient ON Symptoms (PatientID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_diagnosis_patient ON Diagnosis (PatientID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_physicalfitness_patient ON PhysicalFitness (PatientID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prescription_patient ON Prescription (PatientID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prescription_doctor ON Prescription (DoctorID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dispensary_patient ON Dispensary (PatientID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dispensary_doctor ON Dispensary (DoctorID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dispensary_prescription ON Dispensary (PrescriptionID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_billing_patient ON Billing (PatientID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_labtests_compounder ON LabTests (CompounderID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_labtests_date ON LabTests (DateOfTest)")
+
+# Free-text sources indexed for search: code -> (table, ID column, text columns).
+# A note's rowid in NotesSearch is ID * 8 + code, so triggers can update or
+# delete index entries by rowid instead of scanning the index.
+SEARCH_SOURCES = {
+    1: ("Symptoms", "SymptomID", ["Symptoms", "Allergy"]),
+    2: ("Diagnosis", "DiagnosisID", ["Result"]),
+    3: ("HealthyDiets", "DietID", ["DietDescription"]),
+    4: ("PhysicalFitness", "FitnessID", ["TypeOfExercise", "Benefit"]),
+}
 
-create_tables()
+# SQL expression joining a source's text columns, e.g. for NEW.* in a trigger
+def search_body(columns, prefix=""):
+    return " || ' ' || ".join(f"COALESCE({prefix}{column}, '')" for column in columns)
+
+# Version 3: FTS5 index over symptoms, diagnoses, diet plans and exercise notes,
+# kept in sync by triggers on the source tables
+def migration_3_notes_search(conn):
+    c = conn.cursor()
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS NotesSearch USING fts5 (
+                    Body,
+                    PatientID UNINDEXED,
+                    tokenize = 'porter unicode61 remove_diacritics 2'
+                )''')
+    for code, (table, id_column, columns) in SEARCH_SOURCES.items():
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+                          INSERT INTO NotesSearch (rowid, Body, PatientID)
+                          VALUES (NEW.{id_column} * 8 + {code}, {search_body(columns, "NEW.")}, NEW.PatientID);
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE ON {table} BEGIN
+                          DELETE FROM NotesSearch WHERE rowid = OLD.{id_column} * 8 + {code};
+                          INSERT INTO NotesSearch (rowid, Body, PatientID)
+                          VALUES (NEW.{id_column} * 8 + {code}, {search_body(columns, "NEW.")}, NEW.PatientID);
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+                          DELETE FROM NotesSearch WHERE rowid = OLD.{id_column} * 8 + {code};
+                      END''')
+        c.execute(f'''INSERT INTO NotesSearch (rowid, Body, PatientID)
+                      SELECT {id_column} * 8 + {code}, {search_body(columns)}, PatientID FROM {table}''')
+
+# Version 4: calorie rollups maintained by triggers, so form inserts and bulk
+# loads update them incrementally. CalorieDaily holds per-patient daily totals;
+# CalorieDailyTotals holds population totals per day and is in turn maintained
+# from CalorieDaily (a new patient-day row counts one more patient for that day).
+def migration_4_calorie_rollup(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS CalorieDaily (
+                    PatientID INTEGER NOT NULL,
+                    Date TEXT NOT NULL,
+                    TotalCalories INTEGER NOT NULL,
+                    Entries INTEGER NOT NULL,
+                    PRIMARY KEY (PatientID, Date)
+                ) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS CalorieDailyTotals (
+                    Date TEXT PRIMARY KEY,
+                    TotalCalories INTEGER NOT NULL,
+                    Entries INTEGER NOT NULL,
+                    Patients INTEGER NOT NULL
+                ) WITHOUT ROWID''')
+    c.execute('''INSERT INTO CalorieDaily (PatientID, Date, TotalCalories, Entries)
+                 SELECT PatientID, Date, SUM(TotalCalories), COUNT(*) FROM Calories
+                 WHERE PatientID IS NOT NULL GROUP BY PatientID, Date''')
+    c.execute('''INSERT INTO CalorieDailyTotals (Date, TotalCalories, Entries, Patients)
+                 SELECT Date, SUM(TotalCalories), SUM(Entries), COUNT(*) FROM CalorieDaily GROUP BY Date''')
+
+    add_new = '''INSERT INTO CalorieDaily (PatientID, Date, TotalCalories, Entries)
+                 VALUES (NEW.PatientID, NEW.Date, NEW.TotalCalories, 1)
+                 ON CONFLICT (PatientID, Date) DO UPDATE
+                 SET TotalCalories = TotalCalories + excluded.TotalCalories, Entries = Entries + 1;'''
+    remove_old = '''UPDATE CalorieDaily SET TotalCalories = TotalCalories - OLD.TotalCalories, Entries = Entries - 1
+                    WHERE PatientID = OLD.PatientID AND Date = OLD.Date;
+                    DELETE FROM CalorieDaily WHERE PatientID = OLD.PatientID AND Date = OLD.Date AND Entries <= 0;'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS Calories_rollup_insert AFTER INSERT ON Calories
+                  WHEN NEW.PatientID IS NOT NULL BEGIN {add_new} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS Calories_rollup_delete AFTER DELETE ON Calories
+                  WHEN OLD.PatientID IS NOT NULL BEGIN {remove_old} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS Calories_rollup_update_old AFTER UPDATE ON Calories
+                  WHEN OLD.PatientID IS NOT NULL BEGIN {remove_old} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS Calories_rollup_update_new AFTER UPDATE ON Calories
+                  WHEN NEW.PatientID IS NOT NULL BEGIN {add_new} END''')
+
+    c.execute('''CREATE TRIGGER IF NOT EXISTS CalorieDaily_totals_insert AFTER INSERT ON CalorieDaily BEGIN
+                     INSERT INTO CalorieDailyTotals (Date, TotalCalories, Entries, Patients)
+                     VALUES (NEW.Date, NEW.TotalCalories, NEW.Entries, 1)
+                     ON CONFLICT (Date) DO UPDATE SET TotalCalories = TotalCalories + excluded.TotalCalories,
+                                                      Entries = Entries + excluded.Entries, Patients = Patients + 1;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS CalorieDaily_totals_update AFTER UPDATE ON CalorieDaily BEGIN
+                     UPDATE CalorieDailyTotals
+                     SET TotalCalories = TotalCalories + NEW.TotalCalories - OLD.TotalCalories,
+                         Entries = Entries + NEW.Entries - OLD.Entries
+                     WHERE Date = NEW.Date;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS CalorieDaily_totals_delete AFTER DELETE ON CalorieDaily BEGIN
+                     UPDATE CalorieDailyTotals
+                     SET TotalCalories = TotalCalories - OLD.TotalCalories, Entries = Entries - OLD.Entries,
+                         Patients = Patients - 1
+                     WHERE Date = OLD.Date;
+                     DELETE FROM CalorieDailyTotals WHERE Date = OLD.Date AND Patients <= 0;
+                 END''')
+
+# Tables that get a RecordedAt timestamp for the patient timeline
+RECORDED_TABLES = {
+    "HealthyDiets": "DietID", "Symptoms": "SymptomID", "Diagnosis": "DiagnosisID",
+    "PhysicalFitness": "FitnessID", "Prescription": "PrescriptionID",
+    "Dispensary": "DispensaryID", "Billing": "BillNo",
+}
+
+# Version 5: RecordedAt on clinical records and (PatientID, time) indexes, so one
+# patient's history can be read from every table with index seeks. ALTER TABLE
+# cannot add a CURRENT_TIMESTAMP default, so a trigger stamps new rows instead.
+def migration_5_patient_timeline(conn):
+    c = conn.cursor()
+    for table, id_column in RECORDED_TABLES.items():
+        columns = [row[1] for row in c.execute(f"PRAGMA table_info({table})")]
+        if "RecordedAt" not in columns:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN RecordedAt TEXT")
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_recorded_at AFTER INSERT ON {table}
+                      WHEN NEW.RecordedAt IS NULL BEGIN
+                          UPDATE {table} SET RecordedAt = datetime('now') WHERE {id_column} = NEW.{id_column};
+                      END''')
+        c.execute(f"DROP INDEX IF EXISTS idx_{table.lower()}_patient")
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table.lower()}_patient_recorded ON {table} (PatientID, RecordedAt)")
+    c.execute("DROP INDEX IF EXISTS idx_appointments_patient")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointments_patient_date ON Appointments (PatientID, Date, Time)")
+    # Stamping RecordedAt is an UPDATE; limit the search index triggers to the
+    # columns they index so the stamp does not re-index every new note
+    for code, (table, id_column, columns) in SEARCH_SOURCES.items():
+        c.execute(f"DROP TRIGGER IF EXISTS {table}_search_update")
+        c.execute(f'''CREATE TRIGGER {table}_search_update AFTER UPDATE OF {", ".join(columns)}, PatientID
+                      ON {table} BEGIN
+                          DELETE FROM NotesSearch WHERE rowid = OLD.{id_column} * 8 + {code};
+                          INSERT INTO NotesSearch (rowid, Body, PatientID)
+                          VALUES (NEW.{id_column} * 8 + {code}, {search_body(columns, "NEW.")}, NEW.PatientID);
+                      END''')
+
+# Version 6: pharmacy inventory. StockMovements is the ledger of receipts,
+# dispenses and stock counts; StockOnHand holds the current quantity of each
+# medicine, kept by a trigger on the ledger, so reading one medicine's stock is a
+# primary-key lookup. Dispensary rows post their movements from triggers in the
+# same transaction as the dispense itself. Medicine names are compared ignoring
+# case and surrounding spaces. Existing dispenses are loaded into the ledger, so
+# stock starts negative until an opening count or receipt is recorded.
+def migration_6_inventory(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS StockMovements (
+                    MovementID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    Medicine TEXT NOT NULL COLLATE NOCASE,
+                    Change INTEGER NOT NULL,
+                    Kind TEXT NOT NULL,
+                    DispensaryID INTEGER,
+                    Note TEXT,
+                    RecordedAt TEXT NOT NULL DEFAULT (datetime('now')),
+                    FOREIGN KEY (DispensaryID) REFERENCES Dispensary(DispensaryID)
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS StockOnHand (
+                    Medicine TEXT PRIMARY KEY COLLATE NOCASE,
+                    Quantity INTEGER NOT NULL DEFAULT 0,
+                    ReorderLevel INTEGER NOT NULL DEFAULT 0,
+                    UpdatedAt TEXT
+                ) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stockmovements_medicine ON StockMovements (Medicine, MovementID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stockmovements_dispensary ON StockMovements (DispensaryID)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stockonhand_low ON StockOnHand (Medicine) WHERE Quantity <= ReorderLevel")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS StockMovements_on_hand AFTER INSERT ON StockMovements BEGIN
+                     INSERT INTO StockOnHand (Medicine, Quantity, UpdatedAt)
+                     VALUES (NEW.Medicine, NEW.Change, NEW.RecordedAt)
+                     ON CONFLICT (Medicine) DO UPDATE
+                     SET Quantity = Quantity + excluded.Quantity, UpdatedAt = excluded.UpdatedAt;
+                 END''')
+
+    dispense_new = '''INSERT INTO StockMovements (Medicine, Change, Kind, DispensaryID)
+                      SELECT trim(NEW.Medicine), -NEW.Quantity, 'dispense', NEW.DispensaryID
+                      WHERE trim(COALESCE(NEW.Medicine, '')) != '' AND NEW.Quantity != 0;'''
+    reverse_old = '''INSERT INTO StockMovements (Medicine, Change, Kind, DispensaryID)
+                     SELECT trim(OLD.Medicine), OLD.Quantity, 'reversal', OLD.DispensaryID
+                     WHERE trim(COALESCE(OLD.Medicine, '')) != '' AND OLD.Quantity != 0;'''
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS Dispensary_stock_insert AFTER INSERT ON Dispensary BEGIN {dispense_new} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS Dispensary_stock_delete AFTER DELETE ON Dispensary BEGIN {reverse_old} END")
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS Dispensary_stock_update AFTER UPDATE OF Medicine, Quantity
+                  ON Dispensary BEGIN {reverse_old} {dispense_new} END''')
+    c.execute('''INSERT INTO StockMovements (Medicine, Change, Kind, DispensaryID, Note, RecordedAt)
+                 SELECT trim(Medicine), -Quantity, 'dispense', DispensaryID, 'dispensed before stock tracking',
+                        COALESCE(RecordedAt, datetime('now'))
+                 FROM Dispensary
+                 WHERE trim(COALESCE(Medicine, '')) != '' AND COALESCE(Quantity, 0) != 0
+                 ORDER BY DispensaryID''')
+
+# Version 7: appointment scheduling. Each appointment gets StartsAt/EndsAt
+# ("YYYY-MM-DD HH:MM") and a Status, and (DoctorID, StartsAt, EndsAt) is indexed
+# so a doctor's overlapping appointments are found with one range seek (see
+# appointment_conflict). Date and Time are kept for the patient timeline.
+def migration_7_appointments(conn):
+    c = conn.cursor()
+    columns = [row[1] for row in c.execute("PRAGMA table_info(Appointments)")]
+    if "StartsAt" not in columns:
+        c.execute("ALTER TABLE Appointments ADD COLUMN StartsAt TEXT")
+        c.execute("ALTER TABLE Appointments ADD COLUMN EndsAt TEXT")
+        c.execute("ALTER TABLE Appointments ADD COLUMN Status TEXT NOT NULL DEFAULT 'Scheduled'")
+    c.execute('''UPDATE Appointments
+                 SET StartsAt = COALESCE(strftime('%Y-%m-%d %H:%M', Date || ' ' || Time), Date || ' ' || Time)
+                 WHERE StartsAt IS NULL''')
+    c.execute(f'''UPDATE Appointments
+                  SET EndsAt = COALESCE(strftime('%Y-%m-%d %H:%M', StartsAt, '+{APPOINTMENT_MINUTES} minutes'), StartsAt)
+                  WHERE EndsAt IS NULL''')
+    c.execute("DROP INDEX IF EXISTS idx_appointments_doctor_date")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointments_doctor_starts ON Appointments (DoctorID, StartsAt, EndsAt, Status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointments_starts ON Appointments (StartsAt)")
+
+# Version 8: duplicate-patient blocking keys. NameKey (Soundex codes of the first
+# and last name) and PhoneKey (the last ten digits of the phone) are indexed, so
+# possible duplicates of a patient are found with two index seeks and the batch
+# report only compares patients within the same block. The keys are computed in
+# Python (see name_key/phone_key) by the app's insert paths; refresh_patient_keys
+# fills in rows added by other tools. PatientMerges records every merge.
+def migration_8_patient_keys(conn):
+    c = conn.cursor()
+    columns = [row[1] for row in c.execute("PRAGMA table_info(Patients)")]
+    if "NameKey" not in columns:
+        c.execute("ALTER TABLE Patients ADD COLUMN NameKey TEXT")
+        c.execute("ALTER TABLE Patients ADD COLUMN PhoneKey TEXT")
+    rows = c.execute("SELECT PatientID, Name, Phone FROM Patients WHERE NameKey IS NULL").fetchall()
+    c.executemany("UPDATE Patients SET NameKey = ?, PhoneKey = ? WHERE PatientID = ?",
+                  [(name_key(name), phone_key(phone), patient_id) for patient_id, name, phone in rows])
+    c.execute("CREATE INDEX IF NOT EXISTS idx_patients_namekey ON Patients (NameKey)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_patients_phonekey ON Patients (PhoneKey)")
+    c.execute('''CREATE TABLE IF NOT EXISTS PatientMerges (
+                    MergeID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    KeptID INTEGER NOT NULL,
+                    MergedID INTEGER NOT NULL,
+                    MergedName TEXT,
+                    MovedRows INTEGER NOT NULL,
+                    MergedAt TEXT NOT NULL DEFAULT (datetime('now')),
+                    FOREIGN KEY (KeptID) REFERENCES Patients(PatientID)
+                )''')
+
+# Dashboard counters kept by triggers: name -> (table, bucket for inserted rows,
+# bucket for existing rows, column whose updates move a row between buckets).
+# {row} is NEW. or OLD. in the triggers and empty in the backfill. Day buckets
+# are UTC dates, like RecordedAt; a new row is stamped after its insert, so
+# inserts count under today's date.
+COUNTERS = {
+    "patients": ("Patients", "''", "''", None),
+    "doctors": ("Doctors", "''", "''", None),
+    "prescriptions": ("Prescription", "''", "''", None),
+    "dispenses": ("Dispensary", "''", "''", None),
+    "prescriptions_by_day": ("Prescription", "COALESCE(date({row}RecordedAt), date('now'))",
+                             "COALESCE(date({row}RecordedAt), '')", None),
+    "dispenses_by_day": ("Dispensary", "COALESCE(date({row}RecordedAt), date('now'))",
+                         "COALESCE(date({row}RecordedAt), '')", None),
+    "billing_by_mode": ("Billing", "COALESCE({row}ModeOfPayment, '')", "COALESCE({row}ModeOfPayment, '')",
+                        "ModeOfPayment"),
+    "labtests_by_type": ("LabTests", "COALESCE({row}TypeOfTest, '')", "COALESCE({row}TypeOfTest, '')",
+                         "TypeOfTest"),
+}
+
+# SQL adding `delta` to a counter bucket
+def bump_counter(name, bucket, delta):
+    return f"""INSERT INTO Counters (Name, Bucket, Value) VALUES ('{name}', {bucket}, {delta})
+               ON CONFLICT (Name, Bucket) DO UPDATE SET Value = Value + excluded.Value;"""
+
+# Version 9: the Counters summary table behind the Home dashboard. Insert,
+# delete and (for grouped counters) update triggers keep every counter current,
+# so the dashboard reads a handful of primary-key rows instead of counting and
+# grouping whole tables.
+def migration_9_counters(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS Counters (
+                    Name TEXT NOT NULL,
+                    Bucket TEXT NOT NULL,
+                    Value INTEGER NOT NULL,
+                    PRIMARY KEY (Name, Bucket)
+                ) WITHOUT ROWID''')
+    for name, (table, new_bucket, bucket, update_column) in COUNTERS.items():
+        c.execute(f'''INSERT INTO Counters (Name, Bucket, Value)
+                      SELECT '{name}', {bucket.format(row="")}, COUNT(*) FROM {table}
+                      GROUP BY {bucket.format(row="")}''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_counter_{name}_insert AFTER INSERT ON {table} BEGIN
+                          {bump_counter(name, new_bucket.format(row="NEW."), 1)}
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_counter_{name}_delete AFTER DELETE ON {table} BEGIN
+                          {bump_counter(name, bucket.format(row="OLD."), -1)}
+                      END''')
+        if update_column:
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_counter_{name}_update
+                          AFTER UPDATE OF {update_column} ON {table} BEGIN
+                              {bump_counter(name, bucket.format(row="OLD."), -1)}
+                              {bump_counter(name, bucket.format(row="NEW."), 1)}
+                          END''')
+
+# Tables that can be archived: table -> (ID column, date column). Rows whose date
+# is older than the archive cutoff move to one SQLite file per year.
+ARCHIVE_TABLES = {
+    "Calories": ("EntryID", "Date"),
+    "PhysicalFitness": ("FitnessID", "RecordedAt"),
+    "Billing": ("BillNo", "RecordedAt"),
+}
+# Delete triggers that must not fire while rows are being archived, so the
+# calorie rollups and billing counters keep covering archived history
+ARCHIVE_KEEP_TRIGGERS = {
+    "Calories_rollup_delete": """AFTER DELETE ON Calories WHEN OLD.PatientID IS NOT NULL
+                                 AND NOT EXISTS (SELECT 1 FROM Archiving) BEGIN {body} END""",
+    "Billing_counter_billing_by_mode_delete": """AFTER DELETE ON Billing
+                                                 WHEN NOT EXISTS (SELECT 1 FROM Archiving) BEGIN {body} END""",
+}
+
+# Version 10: archival bookkeeping. Archives lists the per-year archive files and
+# their row counts, ArchiveCutoffs the date before which each table has been
+# archived (so views know when a date range needs the archives), and Archiving
+# holds a row only while the archiver deletes rows it has already copied. The
+# delete triggers in ARCHIVE_KEEP_TRIGGERS are recreated to skip those deletes.
+def migration_10_archives(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS Archives (
+                    TableName TEXT NOT NULL,
+                    Year INTEGER NOT NULL,
+                    FileName TEXT NOT NULL,
+                    Rows INTEGER NOT NULL,
+                    PRIMARY KEY (TableName, Year)
+                ) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS ArchiveCutoffs (
+                    TableName TEXT PRIMARY KEY,
+                    ArchivedBefore TEXT NOT NULL
+                )''')
+    c.execute("CREATE TABLE IF NOT EXISTS Archiving (Flag INTEGER)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_physicalfitness_recorded ON PhysicalFitness (RecordedAt)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_billing_recorded ON Billing (RecordedAt)")
+    for name, definition in ARCHIVE_KEEP_TRIGGERS.items():
+        sql = c.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()[0]
+        body = sql[sql.index("BEGIN") + len("BEGIN"):sql.rindex("END")]
+        c.execute(f"DROP TRIGGER {name}")
+        c.execute(f"CREATE TRIGGER {name} " + definition.format(body=body))
+
+# Version 11: archived notes stay searchable. The search index delete triggers
+# of archivable tables skip the archiver's deletes, like the rollup and counter
+# triggers of version 10; archived rows keep their IDs, so their index entries
+# stay valid.
+def migration_11_archive_search(conn):
+    c = conn.cursor()
+    for code, (table, id_column, _) in SEARCH_SOURCES.items():
+        if table in ARCHIVE_TABLES:
+            c.execute(f"DROP TRIGGER IF EXISTS {table}_search_delete")
+            c.execute(f'''CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table}
+                          WHEN NOT EXISTS (SELECT 1 FROM Archiving) BEGIN
+                              DELETE FROM NotesSearch WHERE rowid = OLD.{id_column} * 8 + {code};
+                          END''')
+
+MIGRATIONS = [
+    migration_1_base_schema,
+    migration_2_indexes,
+    migration_3_notes_search,
+    migration_4_calorie_rollup,
+    migration_5_patient_timeline,
+    migration_6_inventory,
+    migration_7_appointments,
+    migration_8_patient_keys,
+    migration_9_counters,
+    migration_10_archives,
+    migration_11_archive_search,
+]
+
+# Bring the database up to the latest schema version. Each migration runs in its
+# own write transaction together with the user_version bump, and the version is
+# re-read under the write lock so concurrent processes never apply one twice.
+def migrate(conn):
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.execute("COMMIT")
+                return version
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+PAGE_SIZE = 50
+
+# Record views shown by the view_* pages: the FROM clause with its joins, the
+# primary key used for keyset pagination and the displayed columns as
+# (column name, SQL expression). Filters and sorting are applied in SQL on
+# these expressions, so only one page of rows ever leaves the database. Views of
+# archivable tables also name that table and its date expression under "archive".
+VIEWS = {
+    "Patients": {
+        "from": "Patients",
+        "key": "Patients.PatientID",
+        "columns": [("PatientID", "Patients.PatientID"), ("Name", "Patients.Name"),
+                    ("Age", "Patients.Age"), ("Gender", "Patients.Gender"),
+                    ("Address", "Patients.Address"), ("Phone", "Patients.Phone")],
+    },
+    "Doctors": {
+        "from": "Doctors",
+        "key": "Doctors.DoctorID",
+        "columns": [("DoctorID", "Doctors.DoctorID"), ("Name", "Doctors.Name"),
+                    ("Specialty", "Doctors.Specialty")],
+    },
+    "HealthyDiets": {
+        "from": """HealthyDiets
+                   JOIN Patients ON HealthyDiets.PatientID = Patients.PatientID
+                   JOIN Doctors ON HealthyDiets.DoctorID = Doctors.DoctorID""",
+        "key": "HealthyDiets.DietID",
+        "columns": [("DietID", "HealthyDiets.DietID"), ("PatientName", "Patients.Name"),
+                    ("DoctorName", "Doctors.Name"), ("DietDescription", "HealthyDiets.DietDescription")],
+    },
+    "Calories": {
+        "from": """Calories
+                   JOIN Patients ON Calories.PatientID = Patients.PatientID
+                   JOIN Doctors ON Calories.DoctorID = Doctors.DoctorID""",
+        "key": "Calories.EntryID",
+        "archive": ("Calories", "Calories.Date"),
+        "columns": [("EntryID", "Calories.EntryID"), ("PatientName", "Patients.Name"),
+                    ("DoctorName", "Doctors.Name"), ("TotalCalories", "Calories.TotalCalories"),
+                    ("Date", "Calories.Date")],
+    },
+    "Symptoms": {
+        "from": "Symptoms JOIN Patients ON Symptoms.PatientID = Patients.PatientID",
+        "key": "Symptoms.SymptomID",
+        "columns": [("PatientID", "Patients.PatientID"), ("PatientName", "Patients.Name"),
+                    ("Symptoms", "Symptoms.Symptoms")],
+    },
+    "Diagnosis": {
+        "from": "Diagnosis JOIN Patients ON Diagnosis.PatientID = Patients.PatientID",
+        "key": "Diagnosis.DiagnosisID",
+        "columns": [("PatientName", "Patients.Name"), ("Result", "Diagnosis.Result")],
+    },
+    "PhysicalFitness": {
+        "from": "PhysicalFitness JOIN Patients ON PhysicalFitness.PatientID = Patients.PatientID",
+        "key": "PhysicalFitness.FitnessID",
+        "archive": ("PhysicalFitness", "PhysicalFitness.RecordedAt"),
+        "columns": [("FitnessID", "PhysicalFitness.FitnessID"), ("PatientName", "Patients.Name"),
+                    ("TypeOfExercise", "PhysicalFitness.TypeOfExercise"),
+                    ("Duration", "PhysicalFitness.Duration"), ("Benefit", "PhysicalFitness.Benefit")],
+    },
+    "Dispensary": {
+        "from": """Dispensary
+                   JOIN Patients ON Dispensary.PatientID = Patients.PatientID
+                   JOIN Doctors ON Dispensary.DoctorID = Doctors.DoctorID
+                   JOIN Prescription ON Dispensary.PrescriptionID = Prescription.PrescriptionID""",
+        "key": "Dispensary.DispensaryID",
+        "columns": [("DispensaryID", "Dispensary.DispensaryID"), ("PatientName", "Patients.Name"),
+                    ("DoctorName", "Doctors.Name"), ("PrescribedMedicine", "Prescription.MedicineName"),
+                    ("DispensedMedicine", "Dispensary.Medicine"), ("Quantity", "Dispensary.Quantity")],
+    },
+    "Prescription": {
+        "from": """Prescription
+                   JOIN Patients ON Prescription.PatientID = Patients.PatientID
+                   JOIN Doctors ON Prescription.DoctorID = Doctors.DoctorID""",
+        "key": "Prescription.PrescriptionID",
+        "columns": [("PrescriptionID", "Prescription.PrescriptionID"), ("PatientName", "Patients.Name"),
+                    ("DoctorName", "Doctors.Name"), ("MedicineName", "Prescription.MedicineName")],
+    },
+    "Billing": {
+        "from": "Billing JOIN Patients ON Billing.PatientID = Patients.PatientID",
+        "key": "Billing.BillNo",
+        "archive": ("Billing", "Billing.RecordedAt"),
+        "columns": [("BillNo", "Billing.BillNo"), ("PatientName", "Patients.Name"),
+                    ("ModeOfPayment", "Billing.ModeOfPayment"), ("ReceiptNo", "Billing.ReceiptNo")],
+    },
+    "LabTests": {
+        "from": "LabTests",
+        "key": "LabTests.TestID",
+        "columns": [("TestID", "LabTests.TestID"), ("TypeOfTest", "LabTests.TypeOfTest"),
+                    ("DateOfTest", "LabTests.DateOfTest")],
+    },
+    "Stock": {
+        "from": "StockOnHand",
+        "key": "StockOnHand.Medicine",
+        "columns": [("Medicine", "StockOnHand.Medicine"), ("Quantity", "StockOnHand.Quantity"),
+                    ("ReorderLevel", "StockOnHand.ReorderLevel"),
+                    ("Status", "CASE WHEN StockOnHand.Quantity <= StockOnHand.ReorderLevel THEN 'Reorder' ELSE 'OK' END"),
+                    ("UpdatedAt", "StockOnHand.UpdatedAt")],
+    },
+    "StockMovements": {
+        "from": "StockMovements",
+        "key": "StockMovements.MovementID",
+        "columns": [("MovementID", "StockMovements.MovementID"), ("Medicine", "StockMovements.Medicine"),
+                    ("Change", "StockMovements.Change"), ("Kind", "StockMovements.Kind"),
+                    ("DispensaryID", "StockMovements.DispensaryID"), ("Note", "StockMovements.Note"),
+                    ("RecordedAt", "StockMovements.RecordedAt")],
+    },
+}
+
+# Build the WHERE clause and parameters for a view's column filters
+# ({column name: text}); each filter is a case-insensitive "contains" match.
+def filter_clause(view, filters):
+    expressions = dict(view["columns"])
+    conditions, params = [], []
+    for column, text in (filters or {}).items():
+        if text:
+            conditions.append(f"{expressions[column]} LIKE ?")
+            params.append(f"%{text}%")
+    return conditions, params
+
+# Build the SELECT for a view with its filters and sort applied. The sort value
+# and the key are appended as two extra trailing columns for keyset pagination.
+# `after` is the (sort value, key) pair of the last row already shown.
+# `nulls` limits a sorted view to the rows whose sort value is NULL (True) or
+# not NULL (False); see fetch_page.
+# `date_range` is an optional (first day, last day) on the view's archive date;
+# `archives` are the attached archive aliases whose rows are read as well.
+def view_query(view_name, after=None, sort=None, descending=False, filters=None, date_range=None, archives=(),
+               nulls=None):
+    view = VIEWS[view_name]
+    expressions = dict(view["columns"])
+    # The bare column, so a sort on an indexed column reads the index in order
+    sort_expr = expressions[sort] if sort else view["key"]
+    direction, op = ("DESC", "<") if descending else ("ASC", ">")
+    conditions, params = filter_clause(view, filters)
+    if nulls is not None:
+        conditions.append(f"{sort_expr} IS {'' if nulls else 'NOT '}NULL")
+    source = view["from"]
+    if date_range:
+        table, date_expr = view["archive"]
+        # Dates and timestamps both compare as text, so the range ends before the following day.
+        # Undated rows (recorded before RecordedAt existed) are never archived and always shown.
+        conditions.append(f"({date_expr} IS NULL OR {date_expr} >= ? AND {date_expr} < ?)")
+        params.extend([str(date_range[0]), str(date_range[1] + datetime.timedelta(days=1))])
+        if archives:
+            source = archived_source(table, archives) + source[len(table):]
+    if after is not None and after[0] is None:
+        conditions.append(f"{view['key']} {op} ?")
+        params.append(after[1])
+    elif after is not None:
+        conditions.append(f"({sort_expr}, {view['key']}) {op} (?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    select = ", ".join(f"{expr} AS {name}" for name, expr in view["columns"])
+    sql = (f"SELECT {select}, {sort_expr}, {view['key']} FROM {source} {where} "
+           f"ORDER BY {sort_expr} {direction}, {view['key']} {direction}")
+    return sql, params
+
+# The archive files a view needs for `date_range`: none when the range starts
+# after the table's archive cutoff, so the default view only reads the hot file
+def view_archives(view_name, date_range):
+    if not date_range or "archive" not in VIEWS[view_name]:
+        return {}
+    return archives_for(VIEWS[view_name]["archive"][0], *date_range)
+
+# Fetch one page of a view. The next page starts right after the `after` cursor,
+# so every page costs the same no matter how deep into the table it is. Returns
+# the column names, the page rows and the cursor for the following page (None on
+# the last page). A sorted view is read as two ranges, rows with a NULL sort
+# value and the rest, each of which can seek an index on the sort column; NULLs
+# come first ascending and last descending, as in SQLite's own ordering, and a
+# page that reaches the end of one range continues at the start of the other.
+def fetch_page(view_name, after=None, sort=None, descending=False, filters=None, limit=PAGE_SIZE, date_range=None):
+    archives = view_archives(view_name, date_range)
+    segments = [None] if sort is None else [False, True] if descending else [True, False]
+    if sort is not None and after is not None:
+        segments = segments[segments.index(after[0] is None):]
+    rows = []
+    for nulls in segments:
+        sql, params = view_query(view_name, after, sort, descending, filters, date_range, archives, nulls)
+        rows += run_query(sql + " LIMIT ?", params + [limit + 1 - len(rows)], archives)
+        if len(rows) > limit:
+            break
+        after = None
+    next_after = tuple(rows[limit - 1][-2:]) if len(rows) > limit else None
+    names = [name for name, _ in VIEWS[view_name]["columns"]]
+    return names, [row[:-2] for row in rows[:limit]], next_after
+
+# Shared paginated table used by all view_* pages. Sort and filter controls are
+# pushed into SQL; the page cursors are kept in session state so Previous/Next
+# only ever fetch one page.
+def show_table(view_name):
+    view = VIEWS[view_name]
+    names = [name for name, _ in view["columns"]]
+    col_sort, col_order, col_filter, col_text = st.columns(4)
+    sort = col_sort.selectbox("Sort by", ["(record ID)"] + names, key=f"{view_name}_sort")
+    descending = col_order.selectbox("Order", ["Ascending", "Descending"], key=f"{view_name}_order") == "Descending"
+    filter_column = col_filter.selectbox("Filter column", names, key=f"{view_name}_filter_column")
+    filter_text = col_text.text_input("Contains", key=f"{view_name}_filter_text")
+    sort = None if sort == "(record ID)" else sort
+    filters = {filter_column: filter_text}
+    # Only the hot database is read unless older records are asked for
+    date_range = None
+    if "archive" in view and st.checkbox("Include archived records", key=f"{view_name}_archived"):
+        today = datetime.date.today()
+        picked = st.date_input("Dates", (today - datetime.timedelta(days=ARCHIVE_AFTER_DAYS + 365), today),
+                               key=f"{view_name}_dates")
+        if len(picked) == 2:
+            date_range = tuple(picked)
+
+    # Start again from the first page whenever the sort or filter changes
+    state_key = f"{view_name}_pages"
+    settings = (sort, descending, filter_column, filter_text, date_range)
+    if st.session_state.get(f"{view_name}_settings") != settings:
+        st.session_state[f"{view_name}_settings"] = settings
+        st.session_state[state_key] = [None]
+    pages = st.session_state[state_key]
+
+    try:
+        columns, rows, next_after = fetch_page(view_name, pages[-1], sort, descending, filters, date_range=date_range)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    st.dataframe(frame_from_batches(columns, [rows]))
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    col_page.write(f"Page {len(pages)}")
+    if col_prev.button("Previous", key=f"{view_name}_prev", disabled=len(pages) == 1):
+        pages.pop()
+        st.rerun()
+    if col_next.button("Next", key=f"{view_name}_next", disabled=next_after is None):
+        pages.append(next_after)
+        st.rerun()
+
+    with st.expander("Export"):
+        export_controls(view_name, sort, descending, filters, date_range)
+
+EXPORT_BATCH_SIZE = 10_000
+EXPORT_FORMATS = {"CSV": ("csv", "text/csv"), "Parquet": ("parquet", "application/octet-stream")}
+# Prepared exports are kept here until a later export finds them older than EXPORT_MAX_AGE_SECONDS
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "hospital_exports")
+EXPORT_MAX_AGE_SECONDS = 3600
+
+# Stream a whole view (with the current filters and sort) in fixed-size batches.
+# Exports read through their own read-only connection rather than the pool, so a
+# long export never holds a pooled connection, and in WAL mode it does not block
+# writers either.
+def iter_view_batches(view_name, sort=None, descending=False, filters=None, batch_size=EXPORT_BATCH_SIZE,
+                      date_range=None):
+    archives = view_archives(view_name, date_range)
+    sql, params = view_query(view_name, None, sort, descending, filters, date_range, archives)
+    conn = sqlite3.connect(f"file:{os.path.abspath(DB_PATH)}?mode=ro", uri=True, check_same_thread=False)
+    started, count, error = time.perf_counter(), 0, None
+    try:
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        attach_archives(conn, archives, read_only=True)
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            count += len(rows)
+            yield [row[:-2] for row in rows]
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        conn.close()
+        record_query(sql, params, started, count, error)
+
+def write_csv(batches, names, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for rows in batches:
+            writer.writerows(rows)
+
+# Each batch becomes one Parquet row group. A column's type is only known once
+# every batch has been seen (it can be all NULL or integers early on and floats
+# or text later), so batches are first spilled to Arrow files on disk and then
+# cast to the common types (see common_type) as they are written out. Columns
+# that are NULL throughout are written as strings.
+def write_parquet(batches, names, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    with tempfile.TemporaryDirectory() as spill:
+        files, types = [], [[] for _ in names]
+        for rows in batches:
+            table = pa.Table.from_arrays([column_array(values) for values in zip(*rows)], names=names)
+            for column_types, field in zip(types, table.schema):
+                column_types.append(field.type)
+            files.append(os.path.join(spill, f"{len(files)}.arrow"))
+            with pa.ipc.new_file(files[-1], table.schema) as writer:
+                writer.write_table(table)
+        schema = pa.schema([pa.field(name, pa.string() if pa.types.is_null(target) else target)
+                            for name, target in zip(names, map(common_type, types))])
+        with pq.ParquetWriter(path, schema) as writer:
+            for file_name in files:
+                with pa.memory_map(file_name) as source:
+                    writer.write_table(pa.ipc.open_file(source).read_all().cast(schema))
+
+# Export a view to a CSV or Parquet file without holding more than one batch of
+# rows in memory. Returns the number of rows written.
+def export_view(view_name, path, fmt="CSV", sort=None, descending=False, filters=None, date_range=None):
+    names = [name for name, _ in VIEWS[view_name]["columns"]]
+    count = 0
+
+    def counted(batches):
+        nonlocal count
+        for rows in batches:
+            count += len(rows)
+            yield rows
+
+    batches = counted(iter_view_batches(view_name, sort, descending, filters, date_range=date_range))
+    if fmt == "Parquet":
+        write_parquet(batches, names, path)
+    else:
+        write_csv(batches, names, path)
+    return count
+
+# Delete prepared exports older than EXPORT_MAX_AGE_SECONDS, including those of
+# sessions that ended without exporting again
+def clean_exports():
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    cutoff = time.time() - EXPORT_MAX_AGE_SECONDS
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass  # removed by another session meanwhile
+
+# Export controls shown under every paginated table. The file is built on disk
+# (in EXPORT_DIR) first and only then offered for download.
+def export_controls(view_name, sort, descending, filters, date_range=None):
+    fmt = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, key=f"{view_name}_export_format")
+    extension, mime = EXPORT_FORMATS[fmt]
+    state_key = f"{view_name}_export"
+    if st.button("Prepare export", key=f"{view_name}_export_prepare"):
+        previous = st.session_state.pop(state_key, None)
+        if previous and os.path.exists(previous[0]):
+            os.remove(previous[0])
+        clean_exports()
+        with tempfile.NamedTemporaryFile(suffix=f".{extension}", dir=EXPORT_DIR, delete=False) as f:
+            path = f.name
+        with st.spinner("Exporting..."):
+            count = export_view(view_name, path, fmt, sort, descending, filters, date_range)
+        st.session_state[state_key] = (path, fmt, count)
+    export = st.session_state.get(state_key)
+    if export and export[1] == fmt and os.path.exists(export[0]):
+        path, fmt, count = export
+        with open(path, "rb") as f:
+            st.download_button(f"Download {count:,} rows", f, file_name=f"{view_name}.{extension}",
+                               mime=mime, key=f"{view_name}_export_download")
+
+LOOKUP_LIMIT = 50
+LOOKUP_INSORT_LIMIT = 100  # new rows added to the prefix index one by one
+
+# Option lists for the patient/doctor/prescription pickers: (table, ID column, label column)
+LOOKUPS = {
+    "patients": ("Patients", "PatientID", "Name"),
+    "doctors": ("Doctors", "DoctorID", "Name"),
+    "prescriptions": ("Prescription", "PrescriptionID", "MedicineName"),
+}
+
+# In-memory picker options shared by all sessions. Each list is loaded once and
+# then kept current by reading only rows whose ID is above the highest ID seen
+# (a single primary-key seek), so rows added by any session, the bulk importer or
+# another process show up without reloading the whole table. Changes that are
+# not plain inserts must call invalidate().
+class LookupCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels = {}  # lookup name -> {ID: label}, in ID order
+        self._index = {}  # lookup name -> sorted [(lowercase label, ID)] for prefix search
+        self._recent = {}  # lookup name -> the LOOKUP_LIMIT highest IDs
+        self._max_id = {}
+
+    def _refresh(self, name):
+        table, id_column, label_column = LOOKUPS[name]
+        rows = run_query(f"SELECT {id_column}, {label_column} FROM {table} WHERE {id_column} > ? ORDER BY {id_column}",
+                         (self._max_id.get(name, 0),))
+        labels = self._labels.setdefault(name, {})
+        index = self._index.setdefault(name, [])
+        recent = self._recent.setdefault(name, collections.deque(maxlen=LOOKUP_LIMIT))
+        for row_id, label in rows:
+            labels[row_id] = f"{row_id}: {label}"
+            recent.append(row_id)
+        entries = [(str(label or "").lower(), row_id) for row_id, label in rows]
+        # insort is cheapest for a few new rows; a first load or a big import
+        # sorts once instead of shifting the list for every row
+        if len(entries) > LOOKUP_INSORT_LIMIT:
+            index.extend(entries)
+            index.sort()
+        else:
+            for entry in entries:
+                bisect.insort(index, entry)
+        if rows:
+            self._max_id[name] = rows[-1][0]
+
+    def labels(self, name):
+        with self._lock:
+            self._refresh(name)
+            return self._labels[name]
+
+    # IDs matching the typed text: an exact ID, then labels starting with the
+    # text. Without text the most recently added entries are offered.
+    def search(self, name, text, limit=LOOKUP_LIMIT):
+        with self._lock:
+            self._refresh(name)
+            labels, index = self._labels[name], self._index[name]
+            text = text.strip().lower()
+            if not text:
+                return list(itertools.islice(reversed(self._recent[name]), limit))
+            matches = [int(text)] if text.isdigit() and int(text) in labels else []
+            start = bisect.bisect_left(index, (text,))
+            for label, row_id in index[start:]:
+                if len(matches) >= limit or not label.startswith(text):
+                    break
+                if row_id not in matches:
+                    matches.append(row_id)
+            return matches
+
+    def invalidate(self, name=None):
+        with self._lock:
+            for key in [name] if name else list(LOOKUPS):
+                self._labels.pop(key, None)
+                self._index.pop(key, None)
+                self._recent.pop(key, None)
+                self._max_id.pop(key, None)
+
+@st.cache_resource
+def get_lookups(path=DB_PATH):
+    return LookupCache()
+
+# Type-ahead picker: a search box narrows the options in memory and the
+# selectbox only ever holds LOOKUP_LIMIT entries. Returns the selected ID.
+def lookup_select(label, name):
+    labels = get_lookups().labels(name)
+    text = st.text_input(f"Search {LOOKUPS[name][0]}", key=f"{label}_search",
+                         placeholder="Type a name or ID")
+    matches = get_lookups().search(name, text)
+    return st.selectbox(label, options=matches, format_func=labels.get)
 
 # Additional functions for handling the database have been added below.
 # Please add these functions into the Streamlit interface by following
@@ -100,18 +1345,233 @@ def add_patient():
     gender = st.radio("Gender", ["Male", "Female", "Other"])
     address = st.text_area("Address")
     phone = st.text_input("Phone")
-    if st.button("Add Patient"):
-        c.execute("INSERT INTO Patients (Name, Age, Gender, Address, Phone) VALUES (?, ?, ?, ?, ?)", 
-                  (name, age, gender, address, phone))
-        conn.commit()
+    candidates = possible_duplicates(name, age, gender, phone) if name.strip() or phone.strip() else []
+    different_person = True
+    if candidates:
+        st.warning("This patient may already be registered:")
+        st.dataframe(frame_from_batches(["PatientID", "Name", "Age", "Gender", "Phone", "Score"],
+                                        [[c[:5] + (round(c[5], 2),) for c in candidates]]), hide_index=True)
+        different_person = st.checkbox("This is a different person")
+    if st.button("Add Patient", disabled=not different_person):
+        insert_row("Patients", {"Name": name, "Age": age, "Gender": gender, "Address": address, "Phone": phone,
+                                "NameKey": name_key(name), "PhoneKey": phone_key(phone)})
         st.success("Patient added successfully!")
 
 # Function to view patient records
 def view_patients():
     st.subheader("Patient Records")
-    patients = c.execute("SELECT * FROM Patients").fetchall()
-    df_patients = pd.DataFrame(patients, columns=["PatientID", "Name", "Age", "Gender", "Address", "Phone"])
-    st.dataframe(df_patients)
+    show_table("Patients")
+
+NAME_TITLES = {"dr", "mr", "mrs", "ms", "miss", "shri", "smt", "kumari"}
+SOUNDEX_CODES = {letter: digit for digit, letters in enumerate(["AEIOUYHW", "BFPV", "CGJKQSXZ", "DT", "L", "MN", "R"])
+                 for letter in letters}
+DUPLICATE_SCORE = 0.9  # candidates scoring at least this are reported
+MIN_NAME_SIMILARITY = 0.6
+CANDIDATE_LIMIT = 50
+MAX_BLOCK_SIZE = 200  # larger blocks are listed in the report instead of compared pairwise
+# Tables whose PatientID is moved to the kept patient when two records are merged
+PATIENT_TABLES = ["Calories", "Symptoms", "Diagnosis", "Prescription", "Dispensary", "Billing",
+                  "HealthyDiets", "PhysicalFitness", "Appointments"]
+
+# Lower-case name words without titles and punctuation
+def name_words(name):
+    words = "".join(c if c.isalnum() else " " for c in str(name or "").lower()).split()
+    return [word for word in words if word not in NAME_TITLES]
+
+# American Soundex: the first letter and three digits for the following consonant sounds
+def soundex(word):
+    letters = [c for c in word.upper() if c in SOUNDEX_CODES]
+    if not letters:
+        return ""
+    code, last = letters[0], SOUNDEX_CODES[letters[0]]
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES[letter]
+        if digit and digit != last:
+            code += str(digit)
+        if letter not in "HW":
+            last = digit
+    return (code + "000")[:4]
+
+# Blocking key for similar-sounding names: the Soundex codes of the first and
+# last name words, sorted so swapped first/last names share a block
+def name_key(name):
+    words = [word for word in name_words(name) if soundex(word)]
+    if not words:
+        return None
+    return " ".join(sorted({soundex(words[0]), soundex(words[-1])}))
+
+# Blocking key for phone numbers: the last ten digits, ignoring spaces, dashes
+# and country codes; None for numbers too short to identify anyone
+def phone_key(phone):
+    digits = "".join(c for c in str(phone or "") if c.isdigit())
+    return digits[-10:] if len(digits) >= 7 else None
+
+# Names repeat a lot within a block, so both steps of the name comparison are cached
+@functools.lru_cache(maxsize=65536)
+def normalized_name(name):
+    return " ".join(name_words(name))
+
+@functools.lru_cache(maxsize=65536)
+def name_similarity(name, other_name):
+    return 1.0 if name == other_name else difflib.SequenceMatcher(None, name, other_name).ratio()
+
+# How alike two patients are: name similarity (0-1), plus 0.5 for the same
+# phone and 0.2 for ages within a year, minus 0.3 each for clearly different
+# ages or genders. An age of 0 counts as unknown. Family members often share a
+# phone, so names less than MIN_NAME_SIMILARITY alike never score as duplicates.
+def match_score(name, age, gender, phone, other_name, other_age, other_gender, other_phone):
+    score = name_similarity(normalized_name(name), normalized_name(other_name))
+    if score < MIN_NAME_SIMILARITY:
+        return score
+    if phone and phone == other_phone:
+        score += 0.5
+    if age and other_age:
+        if abs(age - other_age) <= 1:
+            score += 0.2
+        elif abs(age - other_age) > 5:
+            score -= 0.3
+    if gender and other_gender and gender != other_gender:
+        score -= 0.3
+    return score
+
+# Existing patients that look like the one being entered, best match first:
+# (PatientID, Name, Age, Gender, Phone, score). Only the patient's own name and
+# phone blocks are read, each with an index seek and a limit of its own, so a
+# large block of a common name cannot crowd out the patients sharing the phone.
+def possible_duplicates(name, age, gender, phone, exclude_id=None):
+    key, digits = name_key(name), phone_key(phone)
+    if key is None and digits is None:
+        return []
+    rows = run_query("""SELECT * FROM (SELECT PatientID, Name, Age, Gender, Phone, PhoneKey FROM Patients
+                                       WHERE PhoneKey = ? LIMIT ?)
+                        UNION
+                        SELECT * FROM (SELECT PatientID, Name, Age, Gender, Phone, PhoneKey FROM Patients
+                                       WHERE NameKey = ? LIMIT ?)""", (digits, CANDIDATE_LIMIT, key, CANDIDATE_LIMIT))
+    candidates = []
+    for patient_id, other_name, other_age, other_gender, other_phone, other_digits in rows:
+        score = match_score(name, age, gender, digits, other_name, other_age, other_gender, other_digits)
+        if patient_id != exclude_id and score >= DUPLICATE_SCORE:
+            candidates.append((patient_id, other_name, other_age, other_gender, other_phone, score))
+    return sorted(candidates, key=lambda candidate: -candidate[5])
+
+# Compute the blocking keys of patients added without them (by other tools)
+def refresh_patient_keys():
+    rows = run_query("SELECT PatientID, Name, Phone FROM Patients WHERE NameKey IS NULL")
+    if rows:
+        keys = [(name_key(name), phone_key(phone), patient_id) for patient_id, name, phone in rows]
+        sql = "UPDATE Patients SET NameKey = ?, PhoneKey = ? WHERE PatientID = ?"
+        run_write(lambda conn: conn.executemany(sql, keys), sql, rows=len(keys))
+    return len(rows)
+
+# Likely duplicate pairs in the whole table. Patients are read in NameKey and
+# then PhoneKey order (both straight off their indexes) and only compared with
+# the others in their block, so the work grows with the block sizes instead of
+# with the square of the table. Returns (pairs, oversized blocks); each pair is
+# (score, first patient, second patient) with patients as
+# (PatientID, Name, Age, Gender, Phone).
+def duplicate_report():
+    refresh_patient_keys()
+    pairs, oversized = {}, []
+    for key_column in ("NameKey", "PhoneKey"):
+        rows = run_query(f"""SELECT {key_column}, PatientID, Name, Age, Gender, Phone, PhoneKey FROM Patients
+                             WHERE {key_column} IS NOT NULL ORDER BY {key_column}""")
+        for key, block in itertools.groupby(rows, key=lambda row: row[0]):
+            block = list(block)
+            if len(block) > MAX_BLOCK_SIZE:
+                oversized.append((key_column, key, len(block)))
+                continue
+            for first, second in itertools.combinations(block, 2):
+                if (first[1], second[1]) in pairs:
+                    continue
+                score = match_score(*first[2:5], first[6], *second[2:5], second[6])
+                if score >= DUPLICATE_SCORE:
+                    pairs[first[1], second[1]] = (score, first[1:6], second[1:6])
+    return sorted(pairs.values(), key=lambda pair: -pair[0]), oversized
+
+# Merge a duplicate patient record into the one being kept, in one write: every
+# PatientID reference is moved over (the rollup and search triggers follow the
+# updates), blank contact details of the kept record are filled in from the
+# duplicate, the merge is logged and the duplicate deleted. Archived rows are
+# moved first, in their own files; if the write then fails they already point
+# at the kept patient, and merging again completes the job. Returns the number
+# of rows moved per table.
+def merge_patients(keep_id, duplicate_id):
+    if keep_id == duplicate_id:
+        raise ValueError("Choose two different patients to merge")
+    if len(run_query("SELECT PatientID FROM Patients WHERE PatientID IN (?, ?)", (keep_id, duplicate_id))) != 2:
+        raise ValueError("One of the patients no longer exists")
+    archived, archived_notes = merge_archived_patient(keep_id, duplicate_id)
+
+    def merge(conn):
+        names = dict(conn.execute("SELECT PatientID, Name FROM Patients WHERE PatientID IN (?, ?)",
+                                  (keep_id, duplicate_id)))
+        if len(names) != 2:
+            raise ValueError("One of the patients no longer exists")
+        moved = {}
+        for table in PATIENT_TABLES:
+            moved[table] = conn.execute(f"UPDATE {table} SET PatientID = ? WHERE PatientID = ?",
+                                        (keep_id, duplicate_id)).rowcount + archived.get(table, 0)
+        # What is left of the duplicate's calorie rollup covers archived entries
+        conn.execute("""INSERT INTO CalorieDaily (PatientID, Date, TotalCalories, Entries)
+                        SELECT ?, Date, TotalCalories, Entries FROM CalorieDaily WHERE PatientID = ?
+                        ON CONFLICT (PatientID, Date) DO UPDATE
+                        SET TotalCalories = TotalCalories + excluded.TotalCalories,
+                            Entries = Entries + excluded.Entries""", (keep_id, duplicate_id))
+        conn.execute("DELETE FROM CalorieDaily WHERE PatientID = ?", (duplicate_id,))
+        # Archived notes stay in the search index; their hot source rows are gone
+        conn.execute("UPDATE NotesSearch SET PatientID = ? WHERE rowid IN (SELECT value FROM json_each(?))",
+                     (keep_id, json.dumps(archived_notes)))
+        conn.execute("""UPDATE Patients SET
+                            Address = COALESCE(NULLIF(Address, ''), (SELECT Address FROM Patients WHERE PatientID = ?)),
+                            Phone = COALESCE(NULLIF(Phone, ''), (SELECT Phone FROM Patients WHERE PatientID = ?)),
+                            PhoneKey = COALESCE(PhoneKey, (SELECT PhoneKey FROM Patients WHERE PatientID = ?))
+                        WHERE PatientID = ?""", (duplicate_id, duplicate_id, duplicate_id, keep_id))
+        conn.execute("INSERT INTO PatientMerges (KeptID, MergedID, MergedName, MovedRows) VALUES (?, ?, ?, ?)",
+                     (keep_id, duplicate_id, names[duplicate_id], sum(moved.values())))
+        conn.execute("DELETE FROM Patients WHERE PatientID = ?", (duplicate_id,))
+        return moved
+
+    moved = run_write(merge, "DELETE FROM Patients WHERE PatientID = ?", (duplicate_id,))
+    get_lookups().invalidate("patients")
+    return moved
+
+# Function to find and merge duplicate patient records
+def duplicate_patients_page():
+    st.subheader("Duplicate Patients")
+    if st.button("Scan for duplicates"):
+        with st.spinner("Comparing patients..."):
+            st.session_state["duplicate_report"] = duplicate_report()
+    report = st.session_state.get("duplicate_report")
+    if report is None:
+        st.info("Scan the patient table to list likely duplicates.")
+        return
+    pairs, oversized = report
+    for key_column, key, size in oversized:
+        st.caption(f"Skipped {size:,} patients sharing {key_column} {key}")
+    if not pairs:
+        st.success("No likely duplicates found.")
+        return
+
+    st.write(f"{len(pairs):,} likely duplicate pair(s)")
+    st.dataframe(frame_from_batches(
+        ["Score", "FirstID", "FirstName", "FirstAge", "FirstPhone", "SecondID", "SecondName", "SecondAge", "SecondPhone"],
+        [[(round(score, 2), a[0], a[1], a[2], a[4], b[0], b[1], b[2], b[4]) for score, a, b in pairs]]),
+        hide_index=True)
+    choice = st.selectbox("Pair", range(len(pairs)),
+                          format_func=lambda i: f"{pairs[i][1][0]}: {pairs[i][1][1]} / {pairs[i][2][0]}: {pairs[i][2][1]}")
+    _, first, second = pairs[choice]
+    keep = st.radio("Keep", [first, second], format_func=lambda patient: f"{patient[0]}: {patient[1]}", horizontal=True)
+    duplicate = second if keep == first else first
+    if st.button(f"Merge {duplicate[0]} into {keep[0]}"):
+        try:
+            moved = merge_patients(keep[0], duplicate[0])
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            # Drop every pair that mentions the merged record
+            st.session_state["duplicate_report"] = (
+                [pair for pair in pairs if duplicate[0] not in (pair[1][0], pair[2][0])], oversized)
+            st.success(f"Merged patient {duplicate[0]} into {keep[0]} ({sum(moved.values()):,} records moved)")
 
 # Function to handle user input for adding a doctor
 def add_doctor():
@@ -119,253 +1579,416 @@ def add_doctor():
     name = st.text_input("Doctor's Name")
     specialty = st.text_input("Specialty")
     if st.button("Add Doctor"):
-        c.execute("INSERT INTO Doctors (Name, Specialty) VALUES (?, ?)", (name, specialty))
-        conn.commit()
+        insert_row("Doctors", {"Name": name, "Specialty": specialty})
         st.success("Doctor added successfully!")
 
 # Function to view doctor records
 def view_doctors():
     st.subheader("Doctor Records")
-    doctors = c.execute("SELECT * FROM Doctors").fetchall()
-    df_doctors = pd.DataFrame(doctors, columns=["DoctorID", "Name", "Specialty"])
-    st.dataframe(df_doctors)
+    show_table("Doctors")
+
+APPOINTMENT_MINUTES = 30  # default length, and the slot size of free-slot search
+MAX_APPOINTMENT_MINUTES = 240
+WORKDAY_START = datetime.time(9, 0)
+WORKDAY_END = datetime.time(17, 0)
+CALENDAR_DAYS = 7
+APPOINTMENT_TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+# A doctor's scheduled appointment overlapping [starts_at, ends_at), or None.
+# Appointments are at most MAX_APPOINTMENT_MINUTES long, so any overlap starts
+# within that distance before `starts_at`: the check is a single bounded range
+# seek on (DoctorID, StartsAt) no matter how much history the doctor has.
+def appointment_conflict(conn, doctor_id, starts_at, ends_at, exclude_id=None):
+    earliest = starts_at - datetime.timedelta(minutes=MAX_APPOINTMENT_MINUTES)
+    return conn.execute("""SELECT AppointmentID, StartsAt, EndsAt FROM Appointments
+                           WHERE DoctorID = ? AND StartsAt > ? AND StartsAt < ? AND EndsAt > ?
+                             AND Status = 'Scheduled' AND AppointmentID != ?
+                           LIMIT 1""",
+                        (doctor_id, earliest.strftime(APPOINTMENT_TIME_FORMAT),
+                         ends_at.strftime(APPOINTMENT_TIME_FORMAT), starts_at.strftime(APPOINTMENT_TIME_FORMAT),
+                         exclude_id or 0)).fetchone()
+
+def check_appointment(conn, doctor_id, starts_at, minutes, exclude_id=None):
+    if not 0 < minutes <= MAX_APPOINTMENT_MINUTES:
+        raise ValueError(f"Appointments must be between 1 and {MAX_APPOINTMENT_MINUTES} minutes long")
+    ends_at = starts_at + datetime.timedelta(minutes=minutes)
+    clash = appointment_conflict(conn, doctor_id, starts_at, ends_at, exclude_id)
+    if clash:
+        raise ValueError(f"The doctor already has appointment {clash[0]} from {clash[1]} to {clash[2]}")
+    return ends_at
+
+# Book an appointment and return its ID. The conflict check and the insert run
+# in the same write on the writer thread, so two sessions can never book the
+# same slot. Raises ValueError on a double booking.
+def book_appointment(patient_id, doctor_id, starts_at, minutes=APPOINTMENT_MINUTES, description=""):
+    sql = """INSERT INTO Appointments (PatientID, DoctorID, Date, Time, Description, StartsAt, EndsAt)
+             VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+    def book(conn):
+        ends_at = check_appointment(conn, doctor_id, starts_at, minutes)
+        return conn.execute(sql, (patient_id, doctor_id, starts_at.strftime("%Y-%m-%d"), starts_at.strftime("%H:%M"),
+                                  description, starts_at.strftime(APPOINTMENT_TIME_FORMAT),
+                                  ends_at.strftime(APPOINTMENT_TIME_FORMAT))).lastrowid
+
+    return run_write(book, sql, (patient_id, doctor_id, starts_at))
+
+# Move a scheduled appointment to a new time (and length), with the same check
+def reschedule_appointment(appointment_id, starts_at, minutes=APPOINTMENT_MINUTES):
+    sql = """UPDATE Appointments SET Date = ?, Time = ?, StartsAt = ?, EndsAt = ?
+             WHERE AppointmentID = ? AND Status = 'Scheduled'"""
+
+    def reschedule(conn):
+        row = conn.execute("SELECT DoctorID FROM Appointments WHERE AppointmentID = ? AND Status = 'Scheduled'",
+                           (appointment_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Appointment {appointment_id} is not scheduled")
+        ends_at = check_appointment(conn, row[0], starts_at, minutes, exclude_id=appointment_id)
+        conn.execute(sql, (starts_at.strftime("%Y-%m-%d"), starts_at.strftime("%H:%M"),
+                           starts_at.strftime(APPOINTMENT_TIME_FORMAT), ends_at.strftime(APPOINTMENT_TIME_FORMAT),
+                           appointment_id))
+
+    run_write(reschedule, sql, (appointment_id, starts_at))
+
+# Cancelled appointments stay on record but no longer block their slot
+def cancel_appointment(appointment_id):
+    sql = "UPDATE Appointments SET Status = 'Cancelled' WHERE AppointmentID = ? AND Status = 'Scheduled'"
+    run_write(lambda conn: conn.execute(sql, (appointment_id,)), sql, (appointment_id,))
+
+# Free slots of every doctor on `day` within working hours: all of the day's
+# appointments are read in one range scan and swept per doctor. Returns
+# [(DoctorID, name, specialty, [slot start times])].
+def free_slots(day, minutes=APPOINTMENT_MINUTES, step=APPOINTMENT_MINUTES):
+    day_start = datetime.datetime.combine(day, WORKDAY_START)
+    day_end = datetime.datetime.combine(day, WORKDAY_END)
+    earliest = day_start - datetime.timedelta(minutes=MAX_APPOINTMENT_MINUTES)
+    rows = run_query("""SELECT DoctorID, StartsAt, EndsAt FROM Appointments
+                        WHERE StartsAt > ? AND StartsAt < ? AND EndsAt > ? AND Status = 'Scheduled'
+                        ORDER BY DoctorID, StartsAt""",
+                     (earliest.strftime(APPOINTMENT_TIME_FORMAT), day_end.strftime(APPOINTMENT_TIME_FORMAT),
+                      day_start.strftime(APPOINTMENT_TIME_FORMAT)))
+    busy = collections.defaultdict(list)
+    for doctor_id, starts_at, ends_at in rows:
+        busy[doctor_id].append((datetime.datetime.strptime(starts_at, APPOINTMENT_TIME_FORMAT),
+                                datetime.datetime.strptime(ends_at, APPOINTMENT_TIME_FORMAT)))
+
+    length, step = datetime.timedelta(minutes=minutes), datetime.timedelta(minutes=step)
+    result = []
+    for doctor_id, name, specialty in run_query("SELECT DoctorID, Name, Specialty FROM Doctors ORDER BY Name"):
+        intervals, i, slots = busy.get(doctor_id, []), 0, []
+        # Busy time up to the end of the intervals seen so far; intervals come in start order
+        busy_until = day_start
+        slot = day_start
+        while slot + length <= day_end:
+            while i < len(intervals) and intervals[i][0] < slot + length:
+                busy_until = max(busy_until, intervals[i][1])
+                i += 1
+            if busy_until <= slot:
+                slots.append(slot.time())
+                slot += step
+            else:
+                # Skip to the first step boundary after the busy stretch
+                slot += step * -(-(busy_until - slot) // step)
+        result.append((doctor_id, name, specialty, slots))
+    return result
+
+# Appointments starting in [start, end), optionally for one doctor, as a DataFrame
+def appointments_between(start, end, doctor_id=None):
+    sql = """SELECT Appointments.AppointmentID, Appointments.StartsAt, Appointments.EndsAt, Doctors.Name AS Doctor,
+                    Patients.Name AS Patient, Appointments.Description, Appointments.Status
+             FROM Appointments
+             JOIN Doctors ON Appointments.DoctorID = Doctors.DoctorID
+             JOIN Patients ON Appointments.PatientID = Patients.PatientID
+             WHERE Appointments.StartsAt >= ? AND Appointments.StartsAt < ?"""
+    params = [start.strftime(APPOINTMENT_TIME_FORMAT), end.strftime(APPOINTMENT_TIME_FORMAT)]
+    if doctor_id is not None:
+        sql += " AND Appointments.DoctorID = ?"
+        params.append(doctor_id)
+    return query_frame(sql + " ORDER BY Appointments.StartsAt, Appointments.AppointmentID", params)
 
 # Function to handle user input for scheduling an appointment
+def add_appointment():
+    import pandas as pd
+    st.subheader("Book Appointment")
+    patient_id = lookup_select("Select Patient", "patients")
+    doctor_id = lookup_select("Select Doctor", "doctors")
+    day = st.date_input("Date", min_value=datetime.date.today())
+    at = st.time_input("Time", value=WORKDAY_START, step=datetime.timedelta(minutes=15))
+    minutes = st.number_input("Length (minutes)", min_value=5, max_value=MAX_APPOINTMENT_MINUTES,
+                              value=APPOINTMENT_MINUTES, step=5)
+    description = st.text_area("Description")
+
+    if st.button("Book Appointment", disabled=patient_id is None or doctor_id is None):
+        try:
+            appointment_id = book_appointment(patient_id, doctor_id, datetime.datetime.combine(day, at),
+                                              minutes, description)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.success(f"Appointment {appointment_id} booked!")
 
+    st.subheader(f"Free {minutes}-minute slots on {day:%d %b %Y}")
+    slots = free_slots(day, minutes)
+    st.dataframe(pd.DataFrame(
+        [(name, specialty, len(times), ", ".join(t.strftime("%H:%M") for t in times))
+         for _, name, specialty, times in slots],
+        columns=["Doctor", "Specialty", "FreeSlots", "Times"]))
+
+# Function to show the appointment calendar and reschedule or cancel appointments
+def view_appointments():
+    import pandas as pd
+    st.subheader("Appointments")
+    col_from, col_doctor = st.columns(2)
+    start = col_from.date_input("Week starting", value=datetime.date.today(), key="calendar_start")
+    with col_doctor:
+        doctor_id = lookup_select("Doctor", "doctors") if st.checkbox("One doctor only") else None
+    start = datetime.datetime.combine(start, datetime.time())
+    calendar = appointments_between(start, start + datetime.timedelta(days=CALENDAR_DAYS), doctor_id)
+    if calendar.empty:
+        st.info("No appointments in this week.")
+        return
+
+    starts = pd.to_datetime(calendar["StartsAt"])
+    calendar["Day"] = starts.dt.strftime("%a %d %b")
+    calendar["Time"] = starts.dt.strftime("%H:%M")
+    calendar["Entry"] = calendar["Doctor"] + ": " + calendar["Patient"]
+    calendar.loc[calendar["Status"] == "Cancelled", "Entry"] += " (cancelled)"
+    # One row per start time and one column per day, in date order
+    grid = calendar.pivot_table(index="Time", columns="Day", values="Entry", aggfunc="\n".join)
+    st.dataframe(grid.reindex(columns=list(dict.fromkeys(calendar["Day"]))).fillna(""))
+
+    scheduled = calendar[calendar["Status"] == "Scheduled"]
+    if scheduled.empty:
+        return
+    labels = {row.AppointmentID: f"{row.AppointmentID}: {row.StartsAt} {row.Doctor} / {row.Patient}"
+              for row in scheduled.itertuples()}
+    appointment_id = st.selectbox("Appointment", list(labels), format_func=labels.get)
+    day = st.date_input("New date", key="reschedule_day")
+    at = st.time_input("New time", value=WORKDAY_START, step=datetime.timedelta(minutes=15), key="reschedule_time")
+    minutes = st.number_input("Length (minutes)", min_value=5, max_value=MAX_APPOINTMENT_MINUTES,
+                              value=APPOINTMENT_MINUTES, step=5, key="reschedule_minutes")
+    col_move, col_cancel = st.columns(2)
+    if col_move.button("Reschedule"):
+        try:
+            reschedule_appointment(appointment_id, datetime.datetime.combine(day, at), minutes)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.success(f"Appointment {appointment_id} moved to {day} {at:%H:%M}")
+    if col_cancel.button("Cancel Appointment"):
+        cancel_appointment(appointment_id)
+        st.success(f"Appointment {appointment_id} cancelled")
 
 # Function to add a healthy diet plan
 def add_healthy_diet():
     st.subheader("Add Healthy Diet Plan")
-    patient_data = c.execute("SELECT PatientID, Name FROM Patients").fetchall()
-    doctor_data = c.execute("SELECT DoctorID, Name FROM Doctors").fetchall()
-
-    patient_options = {f"{pid}: {name}": pid for pid, name in patient_data}
-    doctor_options = {f"{did}: {name}": did for did, name in doctor_data}
-
-    selected_patient = st.selectbox("Select Patient for Diet", options=list(patient_options.keys()))
-    selected_doctor = st.selectbox("Select Doctor for Diet", options=list(doctor_options.keys()))
+    patient_id = lookup_select("Select Patient for Diet", "patients")
+    doctor_id = lookup_select("Select Doctor for Diet", "doctors")
     diet_description = st.text_area("Diet Description")
 
-    if st.button("Add Diet Plan"):
-        c.execute("INSERT INTO HealthyDiets (PatientID, DoctorID, DietDescription) VALUES (?, ?, ?)", 
-                  (patient_options[selected_patient], doctor_options[selected_doctor], diet_description))
-        conn.commit()
+    if st.button("Add Diet Plan", disabled=patient_id is None or doctor_id is None):
+        insert_row("HealthyDiets", {"PatientID": patient_id,
+                                    "DoctorID": doctor_id,
+                                    "DietDescription": diet_description})
         st.success("Diet plan added successfully!")
 
 # Function to view healthy diets with patient and doctor names
 def view_healthy_diets():
     st.subheader("Healthy Diets")
-    query = """
-    SELECT HealthyDiets.DietID, Patients.Name AS PatientName, Doctors.Name AS DoctorName, HealthyDiets.DietDescription
-    FROM HealthyDiets
-    JOIN Patients ON HealthyDiets.PatientID = Patients.PatientID
-    JOIN Doctors ON HealthyDiets.DoctorID = Doctors.DoctorID
-    """
-    diets = c.execute(query).fetchall()
-    df_diets = pd.DataFrame(diets, columns=["DietID", "PatientName", "DoctorName", "DietDescription"])
-    st.dataframe(df_diets)
+    show_table("HealthyDiets")
 
 def add_calorie_entry():
     st.subheader("Add Calorie Entry")
-    patient_data = c.execute("SELECT PatientID, Name FROM Patients").fetchall()
-    doctor_data = c.execute("SELECT DoctorID, Name FROM Doctors").fetchall()
-
-    patient_options = {f"{pid}: {name}": pid for pid, name in patient_data}
-    doctor_options = {f"{did}: {name}": did for did, name in doctor_data}
-
-    selected_patient = st.selectbox("Select Patient", options=list(patient_options.keys()))
-    selected_doctor = st.selectbox("Select Doctor", options=list(doctor_options.keys()))
+    patient_id = lookup_select("Select Patient", "patients")
+    doctor_id = lookup_select("Select Doctor", "doctors")
     total_calories = st.number_input("Total Calories", min_value=0, value=0)
     date = st.date_input("Date")
 
-    if st.button("Add Calorie Record"):
-        c.execute("INSERT INTO Calories (PatientID, DoctorID, TotalCalories, Date) VALUES (?, ?, ?, ?)",
-                  (patient_options[selected_patient], doctor_options[selected_doctor], total_calories, date))
-        conn.commit()
+    if st.button("Add Calorie Record", disabled=patient_id is None or doctor_id is None):
+        insert_row("Calories", {"PatientID": patient_id,
+                                "DoctorID": doctor_id,
+                                "TotalCalories": total_calories, "Date": date})
         st.success("Calorie record added successfully!")
 
 def view_calorie_entries():
     st.subheader("View Calorie Entries")
-    calorie_entries = c.execute('''
-        SELECT EntryID, Patients.Name AS PatientName, Doctors.Name AS DoctorName, TotalCalories, Date
-        FROM Calories
-        JOIN Patients ON Calories.PatientID = Patients.PatientID
-        JOIN Doctors ON Calories.DoctorID = Doctors.DoctorID
-    ''').fetchall()
-    df_calorie_entries = pd.DataFrame(calorie_entries, columns=["EntryID", "PatientName", "DoctorName", "TotalCalories", "Date"])
-    st.dataframe(df_calorie_entries)
+    show_table("Calories")
 
 def add_symptoms():
     st.subheader("Add Symptoms for a Patient")
-    patient_data = c.execute("SELECT PatientID, Name FROM Patients").fetchall()
-    patient_options = {f"{pid}: {name}": pid for pid, name in patient_data}
-
-    selected_patient = st.selectbox("Select Patient", options=list(patient_options.keys()))
+    patient_id = lookup_select("Select Patient", "patients")
     symptoms = st.text_area("Symptoms")
     duration = st.text_input("Duration of Symptoms")
     allergy = st.text_input("Known Allergies")
 
-    if st.button("Add Symptoms"):
-        c.execute("INSERT INTO Symptoms (PatientID, Symptoms, Duration, Allergy) VALUES (?, ?, ?, ?)", 
-                  (patient_options[selected_patient], symptoms, duration, allergy))
-        conn.commit()
+    if st.button("Add Symptoms", disabled=patient_id is None):
+        insert_row("Symptoms", {"PatientID": patient_id, "Symptoms": symptoms,
+                                "Duration": duration, "Allergy": allergy})
         st.success("Symptoms added successfully!")
 
 # Function to view symptoms records
 def view_symptoms():
     st.subheader("View Symptoms Records")
-    # Construct SQL query to fetch only the required data
-    query = """
-    SELECT Patients.PatientID, Patients.Name AS PatientName, Symptoms.Symptoms
-    FROM Symptoms
-    JOIN Patients ON Symptoms.PatientID = Patients.PatientID
-    """
-    # Execute SQL query and fetch data
-    symptoms = c.execute(query).fetchall()
-    # Create a pandas DataFrame with the fetched data
-    df_symptoms = pd.DataFrame(symptoms, columns=["PatientID", "PatientName", "Symptoms"])
-    # Display DataFrame in Streamlit
-    st.dataframe(df_symptoms)
+    show_table("Symptoms")
 
 
 def add_diagnosis():
     st.subheader("Add Diagnosis for a Patient")
-    patient_data = c.execute("SELECT PatientID, Name FROM Patients").fetchall()
-    patient_options = {f"{pid}: {name}": pid for pid, name in patient_data}
-    selected_patient = st.selectbox("Select Patient", options=list(patient_options.keys()))
+    patient_id = lookup_select("Select Patient", "patients")
     result = st.text_area("Diagnosis Result")
 
-    if st.button("Add Diagnosis"):
-        c.execute("INSERT INTO Diagnosis (PatientID, Result) VALUES (?, ?)",
-                  (patient_options[selected_patient], result))
-        conn.commit()
+    if st.button("Add Diagnosis", disabled=patient_id is None):
+        insert_row("Diagnosis", {"PatientID": patient_id, "Result": result})
         st.success("Diagnosis added successfully!")
 
 
 # Function to view diagnosis records
 def view_diagnosis():
     st.subheader("View Diagnosis Records")
-    query = """
-    SELECT Patients.Name AS PatientName, Diagnosis.Result
-    FROM Diagnosis
-    JOIN Patients ON Diagnosis.PatientID = Patients.PatientID
-    """
-    diagnosis = c.execute(query).fetchall()
-    df_diagnosis = pd.DataFrame(diagnosis, columns=["PatientName", "Result"])
-    st.dataframe(df_diagnosis)
+    show_table("Diagnosis")
 
 
 # Function to add physical fitness data for a patient
 def add_physical_fitness():
     st.subheader("Add Physical Fitness Data")
-    patient_data = c.execute("SELECT PatientID, Name FROM Patients").fetchall()
-    patient_options = {f"{pid}: {name}": pid for pid, name in patient_data}
-
-    selected_patient = st.selectbox("Select Patient for Fitness Data", options=list(patient_options.keys()))
+    patient_id = lookup_select("Select Patient for Fitness Data", "patients")
     type_of_exercise = st.text_input("Type of Exercise")
     duration = st.text_input("Duration of Exercise")
     benefit = st.text_area("Benefits of the Exercise")
 
-    if st.button("Add Fitness Data"):
-        c.execute("INSERT INTO PhysicalFitness (PatientID, TypeOfExercise, Duration, Benefit) VALUES (?, ?, ?, ?)",
-                  (patient_options[selected_patient], type_of_exercise, duration, benefit))
-        conn.commit()
+    if st.button("Add Fitness Data", disabled=patient_id is None):
+        insert_row("PhysicalFitness", {"PatientID": patient_id,
+                                       "TypeOfExercise": type_of_exercise, "Duration": duration,
+                                       "Benefit": benefit})
         st.success("Physical fitness data added successfully!")
 
 # Function to view physical fitness records
 def view_physical_fitness():
     st.subheader("View Physical Fitness Records")
-    fitness = c.execute("SELECT FitnessID, Patients.Name, TypeOfExercise, Duration, Benefit FROM PhysicalFitness JOIN Patients ON PhysicalFitness.PatientID = Patients.PatientID").fetchall()
-    df_fitness = pd.DataFrame(fitness, columns=["FitnessID", "PatientName", "TypeOfExercise", "Duration", "Benefit"])
-    st.dataframe(df_fitness)
+    show_table("PhysicalFitness")
 # Function to add dispensary data for a patient
 def add_dispensary():
     st.subheader("Add Dispensary Record")
-    patient_data = c.execute("SELECT PatientID, Name FROM Patients").fetchall()
-    doctor_data = c.execute("SELECT DoctorID, Name FROM Doctors").fetchall()
-    prescription_data = c.execute("SELECT PrescriptionID, MedicineName FROM Prescription").fetchall()  # Assuming this table exists
-
-    patient_options = {f"{pid}: {name}": pid for pid, name in patient_data}
-    doctor_options = {f"{did}: {name}": did for did, name in doctor_data}
-    prescription_options = {f"{pid}: {med}": pid for pid, med in prescription_data}
-
-    selected_patient = st.selectbox("Select Patient", options=list(patient_options.keys()))
-    selected_doctor = st.selectbox("Select Doctor", options=list(doctor_options.keys()))
-    selected_prescription = st.selectbox("Select Prescription", options=list(prescription_options.keys()))
+    patient_id = lookup_select("Select Patient", "patients")
+    doctor_id = lookup_select("Select Doctor", "doctors")
+    prescription_id = lookup_select("Select Prescription", "prescriptions")
     medicine = st.text_input("Medicine")
     quantity = st.number_input("Quantity", min_value=0, value=0)
+    stock = stock_level(medicine) if medicine.strip() else None
+    if stock is not None:
+        on_hand, reorder_level = stock
+        st.caption(f"In stock: {on_hand:,} (reorder at {reorder_level:,})")
+        if quantity > on_hand:
+            st.warning(f"Only {on_hand:,} {medicine.strip()} in stock")
+    elif medicine.strip():
+        st.caption("No stock recorded for this medicine")
 
-    if st.button("Add Dispensary Record"):
-        c.execute("INSERT INTO Dispensary (PatientID, DoctorID, PrescriptionID, Medicine, Quantity) VALUES (?, ?, ?, ?, ?)",
-                  (patient_options[selected_patient], doctor_options[selected_doctor], selected_prescription, medicine, quantity))
-        conn.commit()
+    if st.button("Add Dispensary Record", disabled=patient_id is None or doctor_id is None):
+        insert_row("Dispensary", {"PatientID": patient_id,
+                                  "DoctorID": doctor_id,
+                                  "PrescriptionID": prescription_id, "Medicine": medicine.strip(),
+                                  "Quantity": quantity})
         st.success("Dispensary record added successfully!")
 
 # Function to view dispensary records
 def view_dispensary():
     st.subheader("View Dispensary Records")
-    dispensary = c.execute("""
-    SELECT DispensaryID, Patients.Name AS PatientName, Doctors.Name AS DoctorName, Prescription.MedicineName, Dispensary.Medicine, Dispensary.Quantity
-    FROM Dispensary
-    JOIN Patients ON Dispensary.PatientID = Patients.PatientID
-    JOIN Doctors ON Dispensary.DoctorID = Doctors.DoctorID
-    JOIN Prescription ON Dispensary.PrescriptionID = Prescription.PrescriptionID
-    """).fetchall()
-    df_dispensary = pd.DataFrame(dispensary, columns=["DispensaryID", "PatientName", "DoctorName", "PrescribedMedicine", "DispensedMedicine", "Quantity"])
-    st.dataframe(df_dispensary)
+    show_table("Dispensary")
+
+# Current (quantity, reorder level) of a medicine, or None if it has no stock record
+def stock_level(medicine):
+    rows = run_query("SELECT Quantity, ReorderLevel FROM StockOnHand WHERE Medicine = ?", (medicine.strip(),))
+    return rows[0] if rows else None
+
+# Medicines at or below their reorder level, lowest stock first
+def low_stock():
+    return run_query("""SELECT Medicine, Quantity, ReorderLevel FROM StockOnHand
+                        WHERE Quantity <= ReorderLevel ORDER BY Quantity - ReorderLevel, Medicine""")
+
+# Post a receipt ("receipt") or an opening/periodic count ("count") to the stock
+# ledger, optionally changing the medicine's reorder level. A count is stored as
+# the difference from the quantity on hand, read inside the same write so no
+# dispense can slip in between. Returns the change applied.
+def record_stock(medicine, quantity, kind, reorder_level=None, note=None):
+    medicine = medicine.strip()
+
+    def post(conn):
+        change = quantity
+        if kind == "count":
+            row = conn.execute("SELECT Quantity FROM StockOnHand WHERE Medicine = ?", (medicine,)).fetchone()
+            change = quantity - (row[0] if row else 0)
+        if change or kind == "receipt":
+            conn.execute("INSERT INTO StockMovements (Medicine, Change, Kind, Note) VALUES (?, ?, ?, ?)",
+                         (medicine, change, kind, note or None))
+        if reorder_level is not None:
+            conn.execute("""INSERT INTO StockOnHand (Medicine, ReorderLevel, UpdatedAt)
+                            VALUES (?, ?, datetime('now'))
+                            ON CONFLICT (Medicine) DO UPDATE SET ReorderLevel = excluded.ReorderLevel""",
+                         (medicine, reorder_level))
+        return change
+
+    return run_write(post, "INSERT INTO StockMovements (Medicine, Change, Kind, Note) VALUES (?, ?, ?, ?)",
+                     (medicine, quantity, kind, note))
+
+# Function to receive stock or record a stock count
+def receive_stock():
+    st.subheader("Receive Stock")
+    kind = st.radio("Movement", ["Receipt", "Stock count"], horizontal=True)
+    medicine = st.text_input("Medicine")
+    stock = stock_level(medicine) if medicine.strip() else None
+    on_hand, reorder_level = stock if stock is not None else (0, 0)
+    if medicine.strip():
+        st.caption(f"In stock: {on_hand:,} (reorder at {reorder_level:,})")
+    label = "Quantity received" if kind == "Receipt" else "Quantity counted"
+    quantity = st.number_input(label, min_value=0, value=0)
+    new_reorder_level = st.number_input("Reorder level", min_value=0, value=reorder_level)
+    note = st.text_input("Note (supplier, batch, reason)")
+
+    if st.button("Record Stock", disabled=not medicine.strip()):
+        change = record_stock(medicine, quantity, "receipt" if kind == "Receipt" else "count",
+                              new_reorder_level if new_reorder_level != reorder_level or stock is None else None,
+                              note)
+        st.success(f"Stock of {medicine.strip()} updated ({change:+,})")
+
+# Function to view stock on hand, low-stock alerts and the stock ledger
+def view_stock():
+    st.subheader("Pharmacy Stock")
+    low = low_stock()
+    if low:
+        st.warning(f"{len(low)} medicine(s) at or below their reorder level: " +
+                   ", ".join(f"{medicine} ({quantity:,} left)" for medicine, quantity, _ in low))
+    show_table("Stock")
+    st.subheader("Stock Movements")
+    show_table("StockMovements")
 # Function to add prescription data for a patient
 def add_prescription():
     st.subheader("Add Prescription")
-    patient_data = c.execute("SELECT PatientID, Name FROM Patients").fetchall()
-    doctor_data = c.execute("SELECT DoctorID, Name FROM Doctors").fetchall()
-
-    patient_options = {f"{pid}: {name}": pid for pid, name in patient_data}
-    doctor_options = {f"{did}: {name}": did for did, name in doctor_data}
-
-    selected_patient = st.selectbox("Select Patient", options=list(patient_options.keys()))
-    selected_doctor = st.selectbox("Select Doctor", options=list(doctor_options.keys()))
+    patient_id = lookup_select("Select Patient", "patients")
+    doctor_id = lookup_select("Select Doctor", "doctors")
     medicine_name = st.text_input("Medicine Name")
 
-    if st.button("Add Prescription"):
-        c.execute("INSERT INTO Prescription (PatientID, DoctorID, MedicineName) VALUES (?, ?, ?)",
-                  (patient_options[selected_patient], doctor_options[selected_doctor], medicine_name))
-        conn.commit()
+    if st.button("Add Prescription", disabled=patient_id is None or doctor_id is None):
+        insert_row("Prescription", {"PatientID": patient_id,
+                                    "DoctorID": doctor_id,
+                                    "MedicineName": medicine_name})
         st.success("Prescription added successfully!")
 
 # Function to view prescription records
 def view_prescriptions():
     st.subheader("View Prescriptions")
-    prescriptions = c.execute("""
-    SELECT Prescription.PrescriptionID, Patients.Name AS PatientName, Doctors.Name AS DoctorName, Prescription.MedicineName
-    FROM Prescription
-    JOIN Patients ON Prescription.PatientID = Patients.PatientID
-    JOIN Doctors ON Prescription.DoctorID = Doctors.DoctorID
-    """).fetchall()
-    df_prescriptions = pd.DataFrame(prescriptions, columns=["PrescriptionID", "PatientName", "DoctorName", "MedicineName"])
-    st.dataframe(df_prescriptions)
+    show_table("Prescription")
 def add_billing():
     st.subheader("Add Billing Record")
-    patient_data = c.execute("SELECT PatientID, Name FROM Patients").fetchall()
-    patient_options = {f"{pid}: {name}": pid for pid, name in patient_data}
-
-    selected_patient = st.selectbox("Select Patient", options=list(patient_options.keys()))
+    patient_id = lookup_select("Select Patient", "patients")
     mode_of_payment = st.selectbox("Mode of Payment", ["Cash", "Credit Card", "Debit Card", "Online"])
     receipt_no = st.text_input("Receipt Number")
 
-    if st.button("Add Billing Record"):
-        c.execute("INSERT INTO Billing (ModeOfPayment, PatientID, ReceiptNo) VALUES (?, ?, ?)",
-                  (mode_of_payment, patient_options[selected_patient], receipt_no))
-        conn.commit()
+    if st.button("Add Billing Record", disabled=patient_id is None):
+        insert_row("Billing", {"ModeOfPayment": mode_of_payment, "PatientID": patient_id,
+                               "ReceiptNo": receipt_no})
         st.success("Billing record added successfully!")
 def view_billing():
     st.subheader("Billing Records")
-    billing_records = c.execute("""
-    SELECT Billing.BillNo, Patients.Name AS PatientName, Billing.ModeOfPayment, Billing.ReceiptNo
-    FROM Billing
-    JOIN Patients ON Billing.PatientID = Patients.PatientID
-    """).fetchall()
-    df_billing = pd.DataFrame(billing_records, columns=["BillNo", "PatientName", "ModeOfPayment", "ReceiptNo"])
-    st.dataframe(df_billing)
+    show_table("Billing")
 
 def add_lab_test():
     st.subheader("Add Lab Test Record")
@@ -373,107 +1996,908 @@ def add_lab_test():
     date_of_test = st.date_input("Date of Test")
 
     if st.button("Add Lab Test"):
-        c.execute("INSERT INTO LabTests (TypeOfTest, DateOfTest) VALUES (?, ?)",
-                  (type_of_test, date_of_test))
-        conn.commit()
+        insert_row("LabTests", {"TypeOfTest": type_of_test, "DateOfTest": date_of_test})
         st.success("Lab test record added successfully!")
 
 def view_lab_tests():
     st.subheader("Lab Test Records")
-    lab_tests = c.execute("SELECT TestID, TypeOfTest, DateOfTest FROM LabTests").fetchall()
-    df_lab_tests = pd.DataFrame(lab_tests, columns=["TestID", "TypeOfTest", "DateOfTest"])
-    st.dataframe(df_lab_tests)
+    show_table("LabTests")
+
+
+IMPORT_CHUNK_SIZE = 50_000
+REJECT_SAMPLE_SIZE = 1000
+IN_CLAUSE_BATCH = 500
+
+# Tables that can be bulk imported: value columns as {column: (type, required)}
+# and reference columns as {ID column: lookup}. A reference can be given either
+# as the ID column or as the matching name column (PatientName, DoctorName).
+IMPORT_SCHEMAS = {
+    "Patients": {
+        "columns": {"Name": ("text", True), "Age": ("int", True), "Gender": ("text", True),
+                    "Address": ("text", False), "Phone": ("text", False)},
+        "references": {},
+        # Columns computed from another column of the row: {column: (source, function)}
+        "derived": {"NameKey": ("Name", name_key), "PhoneKey": ("Phone", phone_key)},
+    },
+    "Calories": {
+        "columns": {"TotalCalories": ("int", True), "Date": ("date", True)},
+        "references": {"PatientID": "patients", "DoctorID": "doctors"},
+    },
+    "PhysicalFitness": {
+        "columns": {"TypeOfExercise": ("text", False), "Duration": ("text", False), "Benefit": ("text", False)},
+        "references": {"PatientID": "patients"},
+    },
+}
+
+# Stream a CSV or Parquet file as DataFrames of at most chunk_size rows
+def read_chunks(source, name, chunk_size=IMPORT_CHUNK_SIZE):
+    import pandas as pd
+    if name.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[""])
+
+# Return the subset of `ids` that exist in the lookup's table, querying in batches
+def existing_ids(lookup, ids):
+    table, id_column, _ = LOOKUPS[lookup]
+    found = set()
+    ids = list(ids)
+    for start in range(0, len(ids), IN_CLAUSE_BATCH):
+        batch = ids[start:start + IN_CLAUSE_BATCH]
+        placeholders = ", ".join("?" for _ in batch)
+        found.update(row[0] for row in run_query(
+            f"SELECT {id_column} FROM {table} WHERE {id_column} IN ({placeholders})", batch))
+    return found
+
+# Map names to IDs for the names present in one chunk (lowest ID wins on duplicates)
+def ids_by_name(lookup, names):
+    table, id_column, label_column = LOOKUPS[lookup]
+    mapping = {}
+    names = list(names)
+    for start in range(0, len(names), IN_CLAUSE_BATCH):
+        batch = names[start:start + IN_CLAUSE_BATCH]
+        placeholders = ", ".join("?" for _ in batch)
+        mapping.update(run_query(f"SELECT {label_column}, MIN({id_column}) FROM {table} "
+                                 f"WHERE {label_column} IN ({placeholders}) GROUP BY {label_column}", batch))
+    return mapping
+
+# Which values of a numeric Series are whole numbers that fit in a 64-bit integer
+def whole_numbers(values):
+    return values.notna() & (values % 1 == 0) & (values.abs() < 2 ** 63)
+
+# Validate and convert one chunk against the table schema. Returns the insert
+# columns, the clean DataFrame and the rejected rows with a Reason column.
+def prepare_chunk(table, chunk):
+    import pandas as pd
+    schema = IMPORT_SCHEMAS[table]
+    chunk = chunk.reset_index(drop=True)
+    reasons = pd.Series(None, index=chunk.index, dtype=object)
+    frame = pd.DataFrame(index=chunk.index)
+
+    def reject(mask, reason):
+        reasons[mask & reasons.isna()] = reason
+
+    for column, (kind, required) in schema["columns"].items():
+        if column not in chunk:
+            if required:
+                reject(pd.Series(True, index=chunk.index), f"missing column {column}")
+            continue
+        raw = chunk[column]
+        if kind == "int":
+            values = pd.to_numeric(raw, errors="coerce")
+            bad = raw.notna() & (~whole_numbers(values) | (values < 0))
+            reject(bad, f"invalid {column}")
+            # Blank out rejected values first: one 1.5 must not fail the cast for the whole chunk
+            values = values.where(~bad & values.notna()).astype("Int64")
+        elif kind == "date":
+            parsed = pd.to_datetime(raw, errors="coerce", format="%Y-%m-%d")
+            reject(raw.notna() & parsed.isna(), f"invalid {column}")
+            values = parsed.dt.strftime("%Y-%m-%d")
+        else:
+            values = raw.astype("string").str.strip()
+        if required:
+            reject(values.isna(), f"missing {column}")
+        frame[column] = values
+
+    for id_column, lookup in schema["references"].items():
+        name_column = id_column.replace("ID", "Name")
+        if id_column in chunk:
+            ids = pd.to_numeric(chunk[id_column], errors="coerce")
+            ids = ids.where(whole_numbers(ids)).astype("Int64")
+            known = existing_ids(lookup, ids.dropna().unique().tolist())
+            ids = ids.where(ids.isin(known))
+        elif name_column in chunk:
+            names = chunk[name_column].astype("string").str.strip()
+            mapping = ids_by_name(lookup, names.dropna().unique().tolist())
+            ids = names.map(mapping).astype("Int64")
+        else:
+            reject(pd.Series(True, index=chunk.index), f"missing column {id_column} or {name_column}")
+            continue
+        reject(ids.isna(), f"unknown {id_column}")
+        frame[id_column] = ids
+
+    for column, (source, function) in schema.get("derived", {}).items():
+        if source in frame:
+            frame[column] = frame[source].map(function, na_action="ignore")
+
+    ok = reasons.isna()
+    rejected = chunk[~ok].assign(Reason=reasons[~ok])
+    return list(frame.columns), frame[ok], rejected
+
+# Load a CSV/Parquet file into a table chunk by chunk. Each chunk is validated,
+# has its patient/doctor references resolved with a few IN queries and is written
+# with one executemany on the writer thread. `progress` is called after every
+# chunk with the running report.
+def bulk_import(source, table, name=None, chunk_size=IMPORT_CHUNK_SIZE, rejects_path=None, progress=None):
+    name = name or getattr(source, "name", str(source))
+    report = {"table": table, "inserted": 0, "rejected": 0, "seconds": 0.0, "rows_per_second": 0.0,
+              "rejected_sample": []}
+    started = time.perf_counter()
+    for chunk in read_chunks(source, name, chunk_size):
+        columns, clean, rejected = prepare_chunk(table, chunk)
+        if len(clean):
+            placeholders = ", ".join("?" for _ in columns)
+            rows = clean.astype(object).where(clean.notna(), None).itertuples(index=False, name=None)
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+            run_write(lambda conn: conn.executemany(sql, rows), sql, rows=len(clean))
+        if len(rejected):
+            if rejects_path:
+                rejected.to_csv(rejects_path, mode="a", index=False, header=report["rejected"] == 0)
+            room = REJECT_SAMPLE_SIZE - len(report["rejected_sample"])
+            report["rejected_sample"].extend(rejected.head(room).to_dict("records"))
+        report["inserted"] += len(clean)
+        report["rejected"] += len(rejected)
+        report["seconds"] = time.perf_counter() - started
+        report["rows_per_second"] = report["inserted"] / report["seconds"] if report["seconds"] else 0.0
+        if progress:
+            progress(report)
+    return report
+
+# Function to bulk import patients, calorie logs or fitness data from a file
+def bulk_import_page():
+    import pandas as pd
+    st.subheader("Bulk Import")
+    table = st.selectbox("Import into", list(IMPORT_SCHEMAS))
+    schema = IMPORT_SCHEMAS[table]
+    expected = list(schema["columns"]) + [f"{c} or {c.replace('ID', 'Name')}" for c in schema["references"]]
+    st.caption("Expected columns: " + ", ".join(expected))
+    uploaded = st.file_uploader("CSV or Parquet file", type=["csv", "parquet", "pq"])
+
+    if st.button("Import", disabled=uploaded is None):
+        status = st.empty()
+
+        def show_progress(report):
+            status.write(f"{report['inserted']:,} rows imported, {report['rejected']:,} rejected "
+                         f"({report['rows_per_second']:,.0f} rows/s)")
+
+        report = bulk_import(uploaded, table, uploaded.name, progress=show_progress)
+        show_progress(report)
+        st.success(f"Imported {report['inserted']:,} rows into {table} in {report['seconds']:.1f}s")
+        if report["rejected"]:
+            st.warning(f"{report['rejected']:,} rows were rejected; the first {len(report['rejected_sample'])} are shown below")
+            st.dataframe(pd.DataFrame(report["rejected_sample"]))
+
+
+# Records older than this many days are archived unless another cutoff is chosen
+ARCHIVE_AFTER_DAYS = int(os.environ.get("HOSPITAL_ARCHIVE_AFTER_DAYS", "730"))
+ARCHIVE_BATCH_SIZE = 5000  # rows moved per transaction
+ARCHIVE_PAUSE_MS = 50  # pause between batches so the app's writes get the lock
+MAX_ATTACHED_ARCHIVES = 10  # SQLite's default limit of attached databases
+
+# Archive files live next to the database, one per year: hospital_archive_2023.db
+def archive_file(year):
+    stem = os.path.splitext(os.path.basename(DB_PATH))[0]
+    return f"{stem}_archive_{year}.db"
+
+def archive_path(file_name):
+    return os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), file_name)
 
+# Default archive cutoff: records dated before this day are archived
+def archive_cutoff():
+    return datetime.date.today() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+
+# Add columns that the hot table has gained since the archive table was created,
+# so the hot and archived rows still line up in archived_source()
+def sync_archive_columns(conn, alias, table):
+    archived = [row[1] for row in conn.execute(f"PRAGMA {alias}.table_info({table})")]
+    if not archived:
+        return
+    for row in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+        if row[1] not in archived:
+            conn.execute(f"ALTER TABLE {alias}.{table} ADD COLUMN {row[1]} {row[2]}")
+
+# Attach exactly the archive files in `archives` ({alias: file name}) to `conn`,
+# detaching archives a previous query left attached
+def attach_archives(conn, archives, read_only=False):
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    for alias in attached - set(archives):
+        if alias.startswith("archive_"):
+            conn.execute(f"DETACH DATABASE {alias}")
+    for alias, file_name in archives.items():
+        if alias in attached:
+            continue
+        path = archive_path(file_name)
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (f"file:{path}?mode=ro" if read_only else path,))
+        if not read_only:
+            for table in ARCHIVE_TABLES:
+                sync_archive_columns(conn, alias, table)
+
+# Tables with archived rows and the date they are archived before, as
+# (table, date) pairs. The patient chart reads the hot database only.
+def archived_tables():
+    return run_query("""SELECT TableName, ArchivedBefore FROM ArchiveCutoffs
+                        WHERE EXISTS (SELECT 1 FROM Archives WHERE Archives.TableName = ArchiveCutoffs.TableName
+                                                               AND Archives.Rows > 0)
+                        ORDER BY TableName""")
+
+# The archive files holding rows of `table` dated between the two days, as
+# {alias: file name}. Empty when the range starts on or after the table's
+# archive cutoff, since every row from then on is still in the hot database.
+def archives_for(table, first_day, last_day):
+    rows = run_query("""SELECT Archives.Year, Archives.FileName FROM Archives
+                        JOIN ArchiveCutoffs ON ArchiveCutoffs.TableName = Archives.TableName
+                        WHERE Archives.TableName = ? AND Archives.Year BETWEEN ? AND ?
+                          AND ArchiveCutoffs.ArchivedBefore > ?
+                        ORDER BY Archives.Year""", (table, first_day.year, last_day.year, str(first_day)))
+    if len(rows) > MAX_ATTACHED_ARCHIVES:
+        raise ValueError(f"A date range can cover at most {MAX_ATTACHED_ARCHIVES} archived years")
+    return {f"archive_{year}": file_name for year, file_name in rows}
+
+# FROM clause reading a table's hot rows together with its rows in the attached
+# archives. The union keeps the table's name, so view columns and joins work as is.
+def archived_source(table, archives):
+    parts = [f"SELECT * FROM main.{table}"] + [f"SELECT * FROM {alias}.{table}" for alias in archives]
+    return f"({' UNION ALL '.join(parts)}) AS {table}"
+
+# Point archived rows of a merged duplicate patient at the kept patient, in
+# every archive file. Runs on a connection of its own, since ATTACH cannot run
+# inside the writer's transactions. Returns the number of rows moved per table
+# and the search index rowids of the moved notes.
+def merge_archived_patient(keep_id, duplicate_id, pool=None):
+    moved, notes = dict.fromkeys(ARCHIVE_TABLES, 0), []
+    files = run_query("SELECT DISTINCT FileName FROM Archives")
+    if not files:
+        return moved, notes
+    conn = (pool or get_pool())._connect()
+    try:
+        for (file_name,) in files:
+            conn.execute("ATTACH DATABASE ? AS archive_merge", (archive_path(file_name),))
+            try:
+                tables = [row[0] for row in conn.execute("SELECT name FROM archive_merge.sqlite_master "
+                                                         "WHERE type = 'table'") if row[0] in ARCHIVE_TABLES]
+                conn.execute("BEGIN")
+                try:
+                    for code, (table, id_column, _) in SEARCH_SOURCES.items():
+                        if table in tables:
+                            notes += [row[0] for row in conn.execute(
+                                f"SELECT {id_column} * 8 + {code} FROM archive_merge.{table} WHERE PatientID = ?",
+                                (duplicate_id,))]
+                    for table in tables:
+                        moved[table] += conn.execute(f"UPDATE archive_merge.{table} SET PatientID = ? "
+                                                     "WHERE PatientID = ?", (keep_id, duplicate_id)).rowcount
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            finally:
+                conn.execute("DETACH DATABASE archive_merge")
+    finally:
+        conn.close()
+    return moved, notes
+
+# Move one year of `table` (rows dated before `cutoff`) into that year's archive
+# file, `batch_size` rows at a time; `conn` is outside any transaction. Each
+# batch is first copied and committed to the archive, then deleted from the hot
+# database in a second transaction, and only where the archived copy still
+# matches the hot row. WAL transactions are not atomic across files, so a crash
+# between the two steps leaves a copy behind that the next run replaces and
+# completes, instead of losing rows. Returns the number of rows moved.
+def archive_year(conn, table, year, cutoff, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    id_column, date_column = ARCHIVE_TABLES[table]
+    alias, file_name = f"archive_{year}", archive_file(year)
+    columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    unchanged = " AND ".join(f"archived.{column} IS {table}.{column}" for column in columns)
+    conn.execute(f"ATTACH DATABASE ? AS {alias}", (archive_path(file_name),))
+    moved = 0
+    try:
+        conn.execute(f"PRAGMA {alias}.journal_mode=WAL")
+        # Copies must be on disk before the hot rows are deleted
+        conn.execute(f"PRAGMA {alias}.synchronous=FULL")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {alias}.{table} AS SELECT * FROM main.{table} WHERE 0")
+        sync_archive_columns(conn, alias, table)
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {alias}.idx_{table.lower()}_id ON {table} ({id_column})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {alias}.idx_{table.lower()}_date ON {table} ({date_column})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {alias}.idx_{table.lower()}_patient ON {table} (PatientID)")
+        # Register the file before moving rows, so views find every row throughout
+        begin_immediate(conn)
+        conn.execute("""INSERT INTO Archives (TableName, Year, FileName, Rows) VALUES (?, ?, ?, 0)
+                        ON CONFLICT (TableName, Year) DO NOTHING""", (table, year, file_name))
+        conn.execute("COMMIT")
+
+        start, end = f"{year}-01-01", min(str(cutoff), f"{year + 1}-01-01")
+        while True:
+            # The newest row always stays: SQLite numbers new rows from the highest ID
+            # left in the table, and a reused ID would collide with an archived row
+            # (and its search index entry)
+            ids = [row[0] for row in conn.execute(
+                f"SELECT {id_column} FROM main.{table} WHERE {date_column} >= ? AND {date_column} < ? "
+                f"AND {id_column} < (SELECT MAX({id_column}) FROM main.{table}) LIMIT ?",
+                (start, end, batch_size))]
+            if not ids:
+                break
+            batch = json.dumps(ids)
+            conn.execute("BEGIN")
+            try:
+                conn.execute(f"""INSERT OR REPLACE INTO {alias}.{table} SELECT * FROM main.{table}
+                                 WHERE {id_column} IN (SELECT value FROM json_each(?))""", (batch,))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+            begin_immediate(conn)
+            try:
+                # Archiving switches off the delete triggers that would undo rollups and counters
+                conn.execute("INSERT INTO Archiving (Flag) VALUES (1)")
+                deleted = conn.execute(f"""DELETE FROM main.{table}
+                                           WHERE {id_column} IN (SELECT value FROM json_each(?))
+                                             AND EXISTS (SELECT 1 FROM {alias}.{table} AS archived
+                                                         WHERE archived.{id_column} = {table}.{id_column}
+                                                           AND {unchanged})""", (batch,)).rowcount
+                conn.execute("DELETE FROM Archiving")
+                conn.execute("UPDATE Archives SET Rows = Rows + ? WHERE TableName = ? AND Year = ?",
+                             (deleted, table, year))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            moved += deleted
+            if progress:
+                progress(table, year, moved)
+            # A short batch was the last one; rows edited since their copy stay for the next run
+            if len(ids) < batch_size or deleted == 0:
+                break
+            time.sleep(ARCHIVE_PAUSE_MS / 1000)
+    finally:
+        conn.execute(f"DETACH DATABASE {alias}")
+    return moved
+
+# Archive every row of the archivable tables dated before `cutoff`. Runs on its
+# own connection (ATTACH cannot run inside the writer's transactions) and
+# commits in small batches, so the app stays usable while it runs. Returns the
+# number of rows moved per table.
+def archive_rows(cutoff=None, tables=None, batch_size=ARCHIVE_BATCH_SIZE, progress=None, pool=None):
+    cutoff = str(cutoff or archive_cutoff())
+    conn = (pool or get_pool())._connect()
+    report = {}
+    try:
+        for table in tables or ARCHIVE_TABLES:
+            _, date_column = ARCHIVE_TABLES[table]
+            # Raise the cutoff first: views then include the archives while rows move
+            begin_immediate(conn)
+            conn.execute("""INSERT INTO ArchiveCutoffs (TableName, ArchivedBefore) VALUES (?, ?)
+                            ON CONFLICT (TableName) DO UPDATE
+                            SET ArchivedBefore = max(ArchivedBefore, excluded.ArchivedBefore)""", (table, cutoff))
+            conn.execute("COMMIT")
+            # Visit only the years that have rows to move, oldest first
+            report[table], start = 0, ""
+            while True:
+                first = conn.execute(f"SELECT MIN({date_column}) FROM {table} WHERE {date_column} >= ? "
+                                     f"AND {date_column} < ?", (start, cutoff)).fetchone()[0]
+                if not first or not first[:4].isdigit():
+                    break
+                year = int(first[:4])
+                report[table] += archive_year(conn, table, year, cutoff, batch_size, progress)
+                start = f"{year + 1}-01-01"
+    finally:
+        conn.close()
+    return report
+
+# Background archival job shared by all sessions: at most one run at a time,
+# with its progress kept for the Archive page
+class ArchiveJob:
+    def __init__(self, pool):
+        self.pool = pool
+        self.status = {"state": "idle"}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # Start archiving everything before `cutoff`; False if a run is in progress
+    def start(self, cutoff):
+        with self._lock:
+            if self.running:
+                return False
+            self.status = {"state": "running", "cutoff": str(cutoff), "moved": {}, "started": time.time()}
+            self._thread = threading.Thread(target=self._run, args=(cutoff,), name="hospital-db-archiver",
+                                            daemon=True)
+            self._thread.start()
+            return True
+
+    def _progress(self, table, year, moved):
+        self.status["moved"][f"{table} {year}"] = moved
+
+    def _run(self, cutoff):
+        try:
+            report = archive_rows(cutoff, progress=self._progress, pool=self.pool)
+            self.status.update(state="done", report=report, finished=time.time())
+        except Exception as e:
+            self.status.update(state="failed", error=f"{type(e).__name__}: {e}", finished=time.time())
+
+@st.cache_resource
+def get_archiver(path=DB_PATH):
+    return ArchiveJob(get_pool(path))
+
+# Function to move old calorie, fitness and billing records into the yearly archive files
+def archive_page():
+    st.subheader("Archive Old Records")
+    st.caption("Calorie entries, fitness records and bills dated before the cutoff move to one archive "
+               "file per year. The View pages read them again with \"Include archived records\".")
+    job = get_archiver()
+
+    sizes = {os.path.basename(DB_PATH): os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0}
+    archives = query_frame("SELECT TableName, Year, FileName, Rows FROM Archives ORDER BY Year, TableName")
+    for file_name in archives["FileName"].unique():
+        path = archive_path(file_name)
+        sizes[file_name] = os.path.getsize(path) if os.path.exists(path) else 0
+    st.write("Archived records")
+    st.dataframe(archives)
+    st.write("Database files (MB)")
+    st.dataframe({"File": list(sizes), "Size": [round(size / 2 ** 20, 1) for size in sizes.values()]})
+    st.dataframe(query_frame("SELECT TableName, ArchivedBefore FROM ArchiveCutoffs ORDER BY TableName"))
+
+    cutoff = st.date_input("Archive records dated before", archive_cutoff())
+    if st.button("Start archiving", disabled=job.running):
+        if job.start(cutoff):
+            st.success(f"Archiving records before {cutoff} in the background")
+
+    status = job.status
+    if status["state"] == "running":
+        moved = sum(status["moved"].values())
+        st.info(f"Archiving before {status['cutoff']}: {moved:,} records moved so far")
+    elif status["state"] == "done":
+        st.success("Last run moved " + ", ".join(f"{count:,} {table}" for table, count in status["report"].items()))
+    elif status["state"] == "failed":
+        st.error(f"Last run failed: {status['error']}")
+    if st.button("Refresh"):
+        st.rerun()
+    st.caption("The hot database reuses the space freed by archived rows; run VACUUM during "
+               "a quiet period to shrink the file itself.")
+
+
+SEARCH_PAGE_SIZE = 20
+
+# Turn free text into an FTS5 query: every word is quoted so punctuation in the
+# input can never be parsed as query syntax, and the last word matches as a prefix.
+def fts_query(text, match_any=False):
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if not terms:
+        return None
+    terms[-1] += "*"
+    return (" OR " if match_any else " ").join(terms)
+
+# Ranked (bm25) search over the indexed notes. Returns up to `limit` results from
+# `offset` as (source table, record ID, patient ID, patient name, snippet) and
+# whether more results follow.
+def search_notes(text, sources=None, match_any=False, limit=SEARCH_PAGE_SIZE, offset=0):
+    query = fts_query(text, match_any)
+    if query is None:
+        return [], False
+    codes = [code for code, (table, _, _) in SEARCH_SOURCES.items() if not sources or table in sources]
+    placeholders = ", ".join("?" for _ in codes)
+    rows = run_query(f"""
+        SELECT NotesSearch.rowid % 8, NotesSearch.rowid / 8, NotesSearch.PatientID, Patients.Name,
+               snippet(NotesSearch, 0, '**', '**', '...', 16)
+        FROM NotesSearch
+        LEFT JOIN Patients ON Patients.PatientID = NotesSearch.PatientID
+        WHERE NotesSearch MATCH ? AND NotesSearch.rowid % 8 IN ({placeholders})
+        ORDER BY bm25(NotesSearch)
+        LIMIT ? OFFSET ?
+    """, [query] + codes + [limit + 1, offset])
+    results = [(SEARCH_SOURCES[code][0], record_id, patient_id, name, snippet)
+               for code, record_id, patient_id, name, snippet in rows[:limit]]
+    return results, len(rows) > limit
+
+# Function to search patients by the content of their clinical notes
+def search_page():
+    st.subheader("Search Notes")
+    text = st.text_input("Search symptoms, diagnoses, diet plans and exercise notes")
+    col_sources, col_mode = st.columns([3, 1])
+    tables = [table for table, _, _ in SEARCH_SOURCES.values()]
+    sources = col_sources.multiselect("In", tables, default=tables)
+    match_any = col_mode.radio("Match", ["All words", "Any word"]) == "Any word"
+
+    # Start again from the first page whenever the search changes
+    settings = (text, tuple(sources), match_any)
+    if st.session_state.get("search_settings") != settings:
+        st.session_state["search_settings"] = settings
+        st.session_state["search_page"] = 0
+    page = st.session_state["search_page"]
+
+    results, has_more = search_notes(text, sources, match_any, offset=page * SEARCH_PAGE_SIZE)
+    if text and not results:
+        st.info("No matching notes found.")
+    for source, record_id, patient_id, name, snippet in results:
+        st.markdown(f"**{name or 'Unknown patient'}** (Patient {patient_id}) · {source} #{record_id}  \n{snippet}")
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    col_page.write(f"Page {page + 1}")
+    if col_prev.button("Previous", key="search_prev", disabled=page == 0):
+        st.session_state["search_page"] -= 1
+        st.rerun()
+    if col_next.button("Next", key="search_next", disabled=not has_more):
+        st.session_state["search_page"] += 1
+        st.rerun()
+
+
+OUTLIER_Z = 3.0
+
+# Daily calorie totals from the CalorieDaily rollup for a date range, optionally
+# for one patient, sorted by patient and date
+def calorie_daily_frame(start, end, patient_id=None):
+    import pandas as pd
+    sql = "SELECT PatientID, Date, TotalCalories, Entries FROM CalorieDaily WHERE Date BETWEEN ? AND ?"
+    params = [str(start), str(end)]
+    if patient_id is not None:
+        sql += " AND PatientID = ?"
+        params.append(patient_id)
+    daily = query_frame(sql + " ORDER BY PatientID, Date", params)
+    daily["Date"] = pd.to_datetime(daily["Date"])
+    return daily
+
+# Add per-patient rolling 7- and 30-day averages (over logged days) and an
+# outlier flag for days more than OUTLIER_Z standard deviations from the
+# patient's mean. Everything is grouped/rolled column-wise; the frame must be
+# sorted by PatientID and Date.
+def add_calorie_trends(daily):
+    daily = daily.reset_index(drop=True)
+    by_patient = daily.groupby("PatientID", sort=False)
+    for days in (7, 30):
+        rolled = by_patient.rolling(f"{days}D", on="Date")["TotalCalories"].mean()
+        daily[f"Avg{days}"] = rolled.to_numpy()
+    totals = by_patient["TotalCalories"]
+    z = (daily["TotalCalories"] - totals.transform("mean")) / totals.transform("std")
+    daily["Outlier"] = z.abs().to_numpy() > OUTLIER_Z
+    return daily
+
+# Weekly or monthly ("W" or "MS") totals from a daily frame, per patient when
+# the frame has a PatientID column
+def calorie_period_totals(daily, freq):
+    import pandas as pd
+    keys = ["PatientID"] if "PatientID" in daily else []
+    grouped = daily.groupby(keys + [pd.Grouper(key="Date", freq=freq)])
+    return grouped[["TotalCalories", "Entries"]].sum().reset_index()
+
+# Population-wide daily figures read from the CalorieDailyTotals rollup (one row
+# per day), with rolling averages and outlier days by the same z-score rule
+def calorie_population_frame(start, end):
+    import pandas as pd
+    population = query_frame("""
+        SELECT Date, TotalCalories, Entries, Patients FROM CalorieDailyTotals
+        WHERE Date BETWEEN ? AND ? ORDER BY Date
+    """, (str(start), str(end)))
+    population["Date"] = pd.to_datetime(population["Date"])
+    average = population["TotalCalories"] / population["Patients"]
+    population["AveragePerPatient"] = average
+    for days in (7, 30):
+        population[f"Avg{days}"] = population.rolling(f"{days}D", on="Date")["AveragePerPatient"].mean()
+    population["Outlier"] = ((average - average.mean()) / average.std()).abs() > OUTLIER_Z
+    return population
+
+# Function to show calorie trends for the whole population or one patient
+def calorie_trends_page():
+    st.subheader("Calorie Trends")
+    today = datetime.date.today()
+    dates = st.date_input("Date range", value=(today - datetime.timedelta(days=90), today))
+    if len(dates) != 2:
+        st.info("Pick the end of the date range.")
+        return
+    start, end = dates
+    scope = st.radio("Show", ["All patients", "One patient"], horizontal=True)
+
+    if scope == "All patients":
+        daily = calorie_population_frame(start, end)
+        chart_columns = ["AveragePerPatient", "Avg7", "Avg30"]
+    else:
+        patient_id = lookup_select("Patient", "patients")
+        daily = add_calorie_trends(calorie_daily_frame(start, end, patient_id))
+        chart_columns = ["TotalCalories", "Avg7", "Avg30"]
+    if daily.empty:
+        st.info("No calorie entries in this date range.")
+        return
+    st.line_chart(daily.set_index("Date")[chart_columns])
+
+    col_week, col_month = st.columns(2)
+    col_week.write("Weekly totals")
+    col_week.dataframe(calorie_period_totals(daily, "W"))
+    col_month.write("Monthly totals")
+    col_month.dataframe(calorie_period_totals(daily, "MS"))
+    outliers = daily[daily["Outlier"]]
+    st.write(f"Outlier days ({len(outliers):,})")
+    st.dataframe(outliers.drop(columns="Outlier"))
+
+
+TIMELINE_PAGE_SIZE = 25
+
+# Sources of the patient timeline: (source, table, ID column, time, details).
+# Every branch filters on PatientID, which leads an index on each table.
+TIMELINE_SOURCES = [
+    ("Appointment", "Appointments", "AppointmentID", "Date || ' ' || Time",
+     "COALESCE(Description, '') || CASE WHEN Status = 'Cancelled' THEN ' (cancelled)' ELSE '' END"),
+    ("Symptoms", "Symptoms", "SymptomID", "RecordedAt",
+     "Symptoms || ' (for ' || Duration || '; allergies: ' || Allergy || ')'"),
+    ("Diagnosis", "Diagnosis", "DiagnosisID", "RecordedAt", "Result"),
+    ("Prescription", "Prescription", "PrescriptionID", "RecordedAt", "'Prescribed ' || COALESCE(MedicineName, '')"),
+    ("Dispensary", "Dispensary", "DispensaryID", "RecordedAt",
+     "'Dispensed ' || COALESCE(Medicine, '') || ' x' || COALESCE(Quantity, 0)"),
+    ("Billing", "Billing", "BillNo", "RecordedAt", "ModeOfPayment || ', receipt ' || ReceiptNo"),
+    ("Calories", "Calories", "EntryID", "Date", "TotalCalories || ' kcal'"),
+    ("Physical Fitness", "PhysicalFitness", "FitnessID", "RecordedAt",
+     "COALESCE(TypeOfExercise, '') || ' ' || COALESCE(Duration, '') || ': ' || COALESCE(Benefit, '')"),
+    ("Diet Plan", "HealthyDiets", "DietID", "RecordedAt", "DietDescription"),
+]
+
+# One page of a patient's history from all tables in a single UNION ALL query,
+# newest first. `before` is the (time, source, record ID) of the last row shown;
+# rows without a timestamp (recorded before timestamps existed) come last.
+def fetch_timeline(patient_id, before=None, limit=TIMELINE_PAGE_SIZE):
+    branches = [f"SELECT COALESCE({time_expr}, '') AS At, '{source}' AS Source, {id_column} AS RecordID, "
+                f"{details} AS Details FROM {table} WHERE PatientID = ?"
+                for source, table, id_column, time_expr, details in TIMELINE_SOURCES]
+    params = [patient_id] * len(branches)
+    where = ""
+    if before is not None:
+        where = "WHERE (At, Source, RecordID) < (?, ?, ?)"
+        params.extend(before)
+    rows = run_query(f"SELECT At, Source, RecordID, Details FROM ({' UNION ALL '.join(branches)}) {where} "
+                     f"ORDER BY At DESC, Source DESC, RecordID DESC LIMIT ?", params + [limit + 1])
+    next_before = tuple(rows[limit - 1][:3]) if len(rows) > limit else None
+    return rows[:limit], next_before
+
+# Function to show one patient's details and full history
+def patient_chart_page():
+    st.subheader("Patient Chart")
+    patient_id = lookup_select("Select Patient", "patients")
+    if patient_id is None:
+        st.info("No patients found.")
+        return
+    patient = run_query("SELECT Name, Age, Gender, Address, Phone FROM Patients WHERE PatientID = ?", (patient_id,))[0]
+    name, age, gender, address, phone = patient
+    st.markdown(f"**{name}**, {age}, {gender}  \n{address or ''}  \n{phone or ''}")
+
+    archived = archived_tables()
+    if archived:
+        st.info("Not shown here: " + ", ".join(f"{table} records before {before}" for table, before in archived)
+                + ". They are archived; the View pages show them with \"Include archived records\".")
+
+    # Start again from the newest entries whenever another patient is chosen
+    if st.session_state.get("timeline_patient") != patient_id:
+        st.session_state["timeline_patient"] = patient_id
+        st.session_state["timeline_pages"] = [None]
+    pages = st.session_state["timeline_pages"]
+
+    rows, next_before = fetch_timeline(patient_id, pages[-1])
+    if not rows:
+        st.info("Nothing recorded for this patient yet.")
+    st.dataframe(frame_from_batches(["When", "Source", "RecordID", "Details"], [rows]), hide_index=True)
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    col_page.write(f"Page {len(pages)}")
+    if col_prev.button("Newer", key="timeline_prev", disabled=len(pages) == 1):
+        pages.pop()
+        st.rerun()
+    if col_next.button("Older", key="timeline_next", disabled=next_before is None):
+        pages.append(next_before)
+        st.rerun()
+
+
+# Admin panel in the sidebar: statements ranked by total time with their
+# callers, and the query plan of a chosen statement
+def performance_panel():
+    import pandas as pd
+    log = get_query_log()
+    top = log.top()
+    with st.sidebar.expander("Performance", expanded=True):
+        st.caption(f"This rerun took {(time.perf_counter() - SCRIPT_STARTED) * 1000:.1f} ms up to this panel")
+        if not top:
+            st.write("No queries recorded yet.")
+            return
+        st.dataframe(pd.DataFrame([{
+            "Total ms": round(stats["total_ms"], 1),
+            "Calls": stats["calls"],
+            "Avg ms": round(stats["total_ms"] / stats["calls"], 2),
+            "Max ms": round(stats["max_ms"], 1),
+            "Rows": stats["rows"],
+            "Errors": stats["errors"],
+            "Callers": ", ".join(caller for caller in stats["callers"] if caller),
+            "SQL": stats["sql"],
+        } for stats in top]), hide_index=True)
+        choice = st.selectbox("Query plan for", range(len(top)), format_func=lambda i: top[i]["sql"][:80])
+        try:
+            plan = explain_query(top[choice]["sql"], top[choice]["params"])
+        except sqlite3.Error as e:
+            plan = [f"Cannot explain this statement: {e}"]
+        st.code("\n".join(plan))
+        if st.button("Reset statistics"):
+            log.reset()
+            st.rerun()
+
+
+DASHBOARD_TTL_SECONDS = 10
+
+# The dashboard figures from the Counters table: totals, today's prescriptions
+# and dispenses (UTC day) and the billing/lab test breakdowns. Every row is a
+# primary-key seek, and the result is shared by all sessions for
+# DASHBOARD_TTL_SECONDS.
+@st.cache_data(ttl=DASHBOARD_TTL_SECONDS, show_spinner=False)
+def dashboard_counters(today):
+    rows = run_query("""SELECT Name, Bucket, Value FROM Counters
+                        WHERE Name IN ('patients', 'doctors', 'prescriptions', 'dispenses',
+                                       'billing_by_mode', 'labtests_by_type')
+                           OR (Name IN ('prescriptions_by_day', 'dispenses_by_day') AND Bucket = ?)""", (today,))
+    counters = collections.defaultdict(dict)
+    for name, bucket, value in rows:
+        if value:
+            counters[name][bucket] = value
+    return dict(counters)
+
+# Show a row of metrics, at most four to a line
+def metric_rows(items):
+    items = list(items)
+    for start in range(0, len(items), 4):
+        for column, (label, value) in zip(st.columns(4), items[start:start + 4]):
+            column.metric(label, f"{value:,}")
+
+# Function to show the operations dashboard on the Home page
+def dashboard():
+    today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    counters = dashboard_counters(today)
+    total = lambda name, bucket="": counters.get(name, {}).get(bucket, 0)
+    metric_rows([("Patients", total("patients")), ("Doctors", total("doctors")),
+                 ("Prescriptions today", total("prescriptions_by_day", today)),
+                 ("Dispenses today", total("dispenses_by_day", today))])
+    st.write("Bills by mode of payment")
+    metric_rows(sorted(counters.get("billing_by_mode", {}).items(), key=lambda item: -item[1]))
+    st.write("Lab tests by type")
+    metric_rows(sorted(counters.get("labtests_by_type", {}).items(), key=lambda item: -item[1]))
+    st.caption(f"Updated every {DASHBOARD_TTL_SECONDS} seconds")
+
+PAGE_STYLE = """
+<style>
+@import url('https://fonts.googleapis.com/css2?family=Roboto:wght@400;700&display=swap');
+
+h1, .stTitle {
+    font-family: 'Roboto', sans-serif;
+}
+</style>
+"""
+
+# Page images resized to the width they are shown at, decoded and encoded once
+# per process and served from memory on every rerun. Images narrower than the
+# display width are kept as they are.
+@st.cache_resource
+def load_image(name, width):
+    from PIL import Image
+    with Image.open(name) as image:
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
 
 def main():
     st.title("Health And Wellness Community")
-    st.sidebar.image("logo.jpeg", width=100)
-    st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Roboto:wght@400;700&display=swap');
-    
-    h1, .stTitle {
-        font-family: 'Roboto', sans-serif;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-
-    menu = ["Home", "Add Patient", "View Patients", "Add Doctor", "View Doctors", 
-            "Add Healthy Diet", "View Healthy Diets", "Add Symptoms", "View Symptoms","Add Diagnosis", "View Diagnosis","Add Physical Fitness", "View Physical Fitness","Add Dispensary Record","View Dispensary Records","Add Prescription", "View Prescriptions","Add Billing Record", "View Billing Records", "Add Lab Test", "View Lab Tests","Add Calorie Entry", "View Calorie Entries"]
+    st.sidebar.image(load_image("logo.jpeg", 100), width=100)
+    st.markdown(PAGE_STYLE, unsafe_allow_html=True)
+
+
+    menu = ["Home", "Add Patient", "View Patients", "Patient Chart", "Duplicate Patients", "Add Doctor", "View Doctors",
+            "Book Appointment", "View Appointments",
+            "Add Healthy Diet", "View Healthy Diets", "Add Symptoms", "View Symptoms","Add Diagnosis", "View Diagnosis","Add Physical Fitness", "View Physical Fitness","Add Dispensary Record","View Dispensary Records", "Receive Stock", "Pharmacy Stock","Add Prescription", "View Prescriptions","Add Billing Record", "View Billing Records", "Add Lab Test", "View Lab Tests","Add Calorie Entry", "View Calorie Entries", "Calorie Trends", "Search Notes", "Bulk Import", "Archive Old Records"]
     choice = st.sidebar.selectbox("Menu", menu)
 
     if choice == "Home":
         st.subheader("Home")
         st.write("Welcome to the Health And Wellness Community Management System!")
-        st.image("home.jpeg", width=500)
+        st.image(load_image("home.jpeg", 500), width=500)
+        dashboard()
         
     elif choice == "Add Patient":
-        st.image("patient.jpeg", width=150)
+        st.image(load_image("patient.jpeg", 150), width=150)
         add_patient()
     elif choice == "View Patients":
-        st.image("patient.jpeg", width=150)
+        st.image(load_image("patient.jpeg", 150), width=150)
         view_patients()
+    elif choice == "Patient Chart":
+        st.image(load_image("patient.jpeg", 150), width=150)
+        patient_chart_page()
+    elif choice == "Duplicate Patients":
+        duplicate_patients_page()
     elif choice == "Add Doctor":
-        st.image("doctor.jpeg", width=150)
+        st.image(load_image("doctor.jpeg", 150), width=150)
         add_doctor()
     elif choice == "View Doctors":
-        st.image("doctor.jpeg", width=150)
+        st.image(load_image("doctor.jpeg", 150), width=150)
         view_doctors()
+    elif choice == "Book Appointment":
+        add_appointment()
+    elif choice == "View Appointments":
+        view_appointments()
     elif choice == "Add Healthy Diet":
-        st.image("diet.jpeg", width=200)
+        st.image(load_image("diet.jpeg", 200), width=200)
         add_healthy_diet()
     elif choice == "View Healthy Diets":
-        st.image("diet.jpeg", width=200)
+        st.image(load_image("diet.jpeg", 200), width=200)
         view_healthy_diets()
     elif choice == "Add Symptoms":
-        st.image("symptoms.jpeg", width=150)
+        st.image(load_image("symptoms.jpeg", 150), width=150)
         add_symptoms()
     elif choice == "View Symptoms":
-        st.image("symptoms.jpeg", width=150)
+        st.image(load_image("symptoms.jpeg", 150), width=150)
         view_symptoms()
     elif choice == "Add Diagnosis":
-        st.image("diag.jpeg", width=150)
+        st.image(load_image("diag.jpeg", 150), width=150)
         add_diagnosis()
     elif choice == "View Diagnosis":
-        st.image("diag.jpeg", width=150)
+        st.image(load_image("diag.jpeg", 150), width=150)
         view_diagnosis()
     elif choice == "Add Physical Fitness":
-        st.image("fit.jpeg", width=150)
+        st.image(load_image("fit.jpeg", 150), width=150)
         add_physical_fitness()
     elif choice == "View Physical Fitness":
-        st.image("fit.jpeg", width=150)
+        st.image(load_image("fit.jpeg", 150), width=150)
         view_physical_fitness()
     elif choice == "Add Dispensary Record":
-        st.image("disp.jpeg", width=150)
+        st.image(load_image("disp.jpeg", 150), width=150)
         add_dispensary()
     elif choice == "View Dispensary Records":
-        st.image("disp.jpeg", width=150)
+        st.image(load_image("disp.jpeg", 150), width=150)
         view_dispensary()
+    elif choice == "Receive Stock":
+        receive_stock()
+    elif choice == "Pharmacy Stock":
+        view_stock()
     elif choice == "Add Prescription":
-        st.image("prsc.jpeg", width=150)
+        st.image(load_image("prsc.jpeg", 150), width=150)
         add_prescription()
     elif choice == "View Prescriptions":
-        st.image("prsc.jpeg", width=150)
+        st.image(load_image("prsc.jpeg", 150), width=150)
         view_prescriptions()
     elif choice == "Add Billing Record":
-        st.image("bill.jpeg", width=150)
+        st.image(load_image("bill.jpeg", 150), width=150)
         add_billing()
     elif choice == "View Billing Records":
-        st.image("bill.jpeg", width=150)
+        st.image(load_image("bill.jpeg", 150), width=150)
         view_billing()
     elif choice == "Add Lab Test":
-        st.image("lab.jpeg", width=150)
+        st.image(load_image("lab.jpeg", 150), width=150)
         add_lab_test()
     elif choice == "View Lab Tests":
-        st.image("lab.jpeg", width=150)
+        st.image(load_image("lab.jpeg", 150), width=150)
         view_lab_tests()
     elif choice == "Add Calorie Entry":
-        st.image("cal.jpeg", width=150)
+        st.image(load_image("cal.jpeg", 150), width=150)
         add_calorie_entry()
     elif choice == "View Calorie Entries":
-        st.image("cal.jpeg", width=150)
+        st.image(load_image("cal.jpeg", 150), width=150)
         view_calorie_entries()
+    elif choice == "Calorie Trends":
+        st.image(load_image("cal.jpeg", 150), width=150)
+        calorie_trends_page()
+    elif choice == "Search Notes":
+        search_page()
+    elif choice == "Bulk Import":
+        bulk_import_page()
+    elif choice == "Archive Old Records":
+        archive_page()
+
+    if st.sidebar.checkbox("Show performance panel"):
+        performance_panel()
 
 # The above is the main function to call the rest of the code
 if __name__ == '__main__':
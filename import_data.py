@@ -0,0 +1,37 @@
+import argparse
+import os
+import sys
+
+# Command line entry point for the bulk importer in health.py, e.g.
+#   python import_data.py calories.parquet --table Calories --db hospital.db
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import a CSV or Parquet file into the hospital database.")
+    parser.add_argument("path", help="CSV or Parquet file to import")
+    parser.add_argument("--table", required=True, help="Patients, Calories or PhysicalFitness")
+    parser.add_argument("--db", default=None, help="database file (defaults to HOSPITAL_DB or hospital.db)")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="rows per chunk and per transaction")
+    parser.add_argument("--rejects", default=None, help="write rejected rows with their reason to this CSV")
+    args = parser.parse_args()
+
+    # health.py reads the database location when it is imported
+    if args.db:
+        os.environ["HOSPITAL_DB"] = args.db
+    import health
+
+    if args.table not in health.IMPORT_SCHEMAS:
+        parser.error(f"--table must be one of {', '.join(health.IMPORT_SCHEMAS)}")
+
+    def show_progress(report):
+        print(f"\r{report['inserted']:,} imported, {report['rejected']:,} rejected, "
+              f"{report['rows_per_second']:,.0f} rows/s", end="", file=sys.stderr)
+
+    report = health.bulk_import(args.path, args.table, chunk_size=args.chunk_size,
+                                rejects_path=args.rejects, progress=show_progress)
+    print(file=sys.stderr)
+    print(f"Imported {report['inserted']:,} rows into {args.table} in {report['seconds']:.1f}s "
+          f"({report['rows_per_second']:,.0f} rows/s); {report['rejected']:,} rejected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
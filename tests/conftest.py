@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# health.py reads the database location when it is imported, so the tests get a
+# fresh database (and archive directory) of their own
+os.environ["HOSPITAL_DB"] = os.path.join(tempfile.mkdtemp(), "hospital.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def health():
+    import health
+    health.get_pool()
+    return health
+
+
+# A patient and a doctor of their own for tests that change the database
+@pytest.fixture
+def patient(health):
+    return health.insert_row("Patients", {"Name": "Test Patient", "Age": 40, "Gender": "Female"})
+
+
+@pytest.fixture
+def doctor(health):
+    return health.insert_row("Doctors", {"Name": "Dr. Test", "Specialty": "Nutrition"})
+
+
+# Daily calorie rollup rows of one patient as (Date, TotalCalories, Entries)
+@pytest.fixture
+def calorie_rollup(health):
+    return lambda patient_id: health.run_query("""SELECT Date, TotalCalories, Entries FROM CalorieDaily
+                                                  WHERE PatientID = ? ORDER BY Date""", (patient_id,))
+
+
+# The population totals as stored in CalorieDailyTotals and as recomputed from CalorieDaily
+@pytest.fixture
+def calorie_totals(health):
+    def totals():
+        stored = health.run_query("SELECT Date, TotalCalories, Entries, Patients FROM CalorieDailyTotals ORDER BY Date")
+        recomputed = health.run_query("""SELECT Date, SUM(TotalCalories), SUM(Entries), COUNT(*) FROM CalorieDaily
+                                         GROUP BY Date ORDER BY Date""")
+        return stored, recomputed
+    return totals
@@ -0,0 +1,92 @@
+import datetime
+
+# Archiving old rows into yearly files: the hot tables, the rollups and the
+# search index before and after, and views reading the archives back
+
+
+def add_calories(health, patient, doctor, date, calories=100):
+    return health.insert_row("Calories", {"PatientID": patient, "DoctorID": doctor, "TotalCalories": calories,
+                                          "Date": date})
+
+
+def add_fitness(health, patient, benefit, recorded_at):
+    return health.insert_row("PhysicalFitness", {"PatientID": patient, "TypeOfExercise": "Swimming",
+                                                 "Duration": "30 min", "Benefit": benefit, "RecordedAt": recorded_at})
+
+
+def test_archive_moves_old_rows_and_views_read_them_back(health, patient, doctor, calorie_rollup, calorie_totals):
+    dates = ["2015-03-01", "2015-03-01", "2016-07-04"]
+    for date in dates:
+        add_calories(health, patient, doctor, date)
+    recent = add_calories(health, patient, doctor, "2024-05-01")
+    rollup, (totals, _) = calorie_rollup(patient), calorie_totals()
+
+    health.archive_rows(datetime.date(2017, 1, 1), ["Calories"])
+    assert {(2015,), (2016,)} <= set(health.run_query("SELECT Year FROM Archives WHERE TableName = 'Calories'"))
+    hot = health.run_query("SELECT EntryID FROM Calories WHERE PatientID = ?", (patient,))
+    assert hot == [(recent,)]
+    # Rollups keep covering archived history
+    assert calorie_rollup(patient) == rollup and calorie_totals()[0] == totals
+
+    filters = {"PatientName": "Test Patient"}
+    _, rows, _ = health.fetch_page("Calories", filters=filters, limit=1000)
+    assert "2015-03-01" not in [row[-1] for row in rows]
+    _, rows, _ = health.fetch_page("Calories", filters=filters, limit=1000,
+                                   date_range=(datetime.date(2015, 1, 1), datetime.date(2016, 12, 31)))
+    assert sorted(row[-1] for row in rows) == dates
+    exported = [row for batch in health.iter_view_batches("Calories", date_range=(datetime.date(2015, 1, 1),
+                                                                                  datetime.date(2015, 12, 31)))
+                for row in batch]
+    assert len(exported) == 2
+    assert ("Calories", "2017-01-01") in health.archived_tables()
+
+    # Running again finds nothing left to move
+    assert health.archive_rows(datetime.date(2017, 1, 1), ["Calories"]) == {"Calories": 0}
+
+
+def test_newest_row_is_never_archived(health, patient, doctor):
+    newest = add_calories(health, patient, doctor, "2012-01-01")
+    health.archive_rows(datetime.date(2013, 1, 1), ["Calories"])
+    assert health.run_query("SELECT EntryID FROM Calories WHERE EntryID = ?", (newest,)) == [(newest,)]
+    assert add_calories(health, patient, doctor, "2024-01-01") == newest + 1
+
+
+def test_archived_notes_stay_searchable(health, patient):
+    note = add_fitness(health, patient, "eases exercise induced bronchospasm", "2013-04-01 10:00:00")
+    add_fitness(health, patient, "better stamina", "2024-04-01 10:00:00")
+    health.archive_rows(datetime.date(2014, 1, 1), ["PhysicalFitness"])
+    assert health.run_query("SELECT COUNT(*) FROM PhysicalFitness WHERE FitnessID = ?", (note,)) == [(0,)]
+    results, _ = health.search_notes("bronchospasm")
+    assert [(table, record, patient_id) for table, record, patient_id, *_ in results] == \
+        [("PhysicalFitness", note, patient)]
+
+
+def test_merge_moves_archived_rows_notes_and_rollup(health, doctor, calorie_rollup, calorie_totals):
+    keep = health.insert_row("Patients", {"Name": "Kept Archive", "Age": 30, "Gender": "Male"})
+    duplicate = health.insert_row("Patients", {"Name": "Merged Archive", "Age": 30, "Gender": "Male"})
+    add_calories(health, duplicate, doctor, "2014-06-01", 250)
+    note = add_fitness(health, duplicate, "eases chronic sciatica", "2014-06-01 08:00:00")
+    add_calories(health, keep, doctor, "2024-06-01")
+    add_fitness(health, keep, "better stamina", "2024-06-01 08:00:00")
+    health.archive_rows(datetime.date(2015, 1, 1), ["Calories", "PhysicalFitness"])
+
+    moved = health.merge_patients(keep, duplicate)
+    assert moved["Calories"] == 1 and moved["PhysicalFitness"] == 1
+    assert calorie_rollup(keep) == [("2014-06-01", 250, 1), ("2024-06-01", 100, 1)]
+    assert calorie_rollup(duplicate) == []
+    stored, recomputed = calorie_totals()
+    assert stored == recomputed
+    _, rows, _ = health.fetch_page("Calories", filters={"PatientName": "Kept Archive"},
+                                   date_range=(datetime.date(2014, 1, 1), datetime.date(2014, 12, 31)))
+    assert [row[-1] for row in rows] == ["2014-06-01"]
+    results, _ = health.search_notes("sciatica")
+    assert [(record, patient_id) for _, record, patient_id, *_ in results] == [(note, keep)]
+
+
+def test_undated_rows_stay_visible_with_a_date_range(health, patient):
+    bill = health.insert_row("Billing", {"PatientID": patient, "ModeOfPayment": "Cash", "ReceiptNo": "UNDATED"})
+    with health.transaction() as conn:
+        conn.execute("UPDATE Billing SET RecordedAt = NULL WHERE BillNo = ?", (bill,))
+    _, rows, _ = health.fetch_page("Billing", filters={"ReceiptNo": "UNDATED"},
+                                   date_range=(datetime.date(2015, 1, 1), datetime.date(2015, 12, 31)))
+    assert [row[0] for row in rows] == [bill]
@@ -0,0 +1,37 @@
+# Bulk import: every bad row is rejected with its reason while the rest of the
+# file is imported
+
+
+def write_csv(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_bad_rows_are_rejected_one_by_one(health, tmp_path, patient, doctor):
+    path = write_csv(tmp_path / "calories.csv", f"""PatientID,DoctorID,TotalCalories,Date
+{patient},{doctor},1800,2024-01-01
+{patient},{doctor},1.5,2024-01-02
+{patient},{doctor},-5,2024-01-03
+{patient},{doctor},,2024-01-04
+{patient},{doctor},1900,01/05/2024
+999999999,{doctor},2000,2024-01-06
+{patient},{doctor},2100,2024-01-07
+""")
+    report = health.bulk_import(path, "Calories", chunk_size=3)
+    assert (report["inserted"], report["rejected"]) == (2, 5)
+    assert [row["Reason"] for row in report["rejected_sample"]] == [
+        "invalid TotalCalories", "invalid TotalCalories", "missing TotalCalories", "invalid Date", "unknown PatientID"]
+    assert health.run_query("SELECT TotalCalories, Date FROM Calories WHERE PatientID = ? ORDER BY Date",
+                            (patient,)) == [(1800, "2024-01-01"), (2100, "2024-01-07")]
+
+
+def test_references_can_be_given_by_name(health, tmp_path, doctor):
+    patient = health.insert_row("Patients", {"Name": "Imported By Name", "Age": 33, "Gender": "Male"})
+    path = write_csv(tmp_path / "fitness.csv", """PatientName,TypeOfExercise,Duration,Benefit
+Imported By Name,Yoga,30 min,flexibility
+Nobody By That Name,Yoga,30 min,flexibility
+""")
+    report = health.bulk_import(path, "PhysicalFitness")
+    assert (report["inserted"], report["rejected"]) == (1, 1)
+    assert [row["Reason"] for row in report["rejected_sample"]] == ["unknown PatientID"]
+    assert health.run_query("SELECT TypeOfExercise FROM PhysicalFitness WHERE PatientID = ?", (patient,)) == [("Yoga",)]
@@ -0,0 +1,14 @@
+# The calorie rollup tables follow every insert, update and delete of Calories
+
+
+def test_calorie_rollups_follow_every_change(health, patient, doctor, calorie_rollup, calorie_totals):
+    entries = [health.insert_row("Calories", {"PatientID": patient, "DoctorID": doctor, "TotalCalories": calories,
+                                              "Date": date})
+               for calories, date in [(1000, "2024-02-01"), (500, "2024-02-01"), (700, "2024-02-02")]]
+    assert calorie_rollup(patient) == [("2024-02-01", 1500, 2), ("2024-02-02", 700, 1)]
+    with health.transaction() as conn:
+        conn.execute("UPDATE Calories SET Date = '2024-02-02', TotalCalories = 300 WHERE EntryID = ?", (entries[0],))
+        conn.execute("DELETE FROM Calories WHERE EntryID = ?", (entries[2],))
+    assert calorie_rollup(patient) == [("2024-02-01", 500, 1), ("2024-02-02", 300, 1)]
+    stored, recomputed = calorie_totals()
+    assert stored == recomputed
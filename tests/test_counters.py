@@ -0,0 +1,13 @@
+# Dashboard counters kept by triggers agree with counting the tables
+
+
+def test_counters_match_full_counts(health, patient):
+    health.insert_row("Billing", {"PatientID": patient, "ModeOfPayment": "Cheque", "ReceiptNo": "T1"})
+    bill = health.insert_row("Billing", {"PatientID": patient, "ModeOfPayment": "Cheque", "ReceiptNo": "T2"})
+    with health.transaction() as conn:
+        conn.execute("UPDATE Billing SET ModeOfPayment = 'Cash' WHERE BillNo = ?", (bill,))
+    for name, (table, _, bucket, _) in health.COUNTERS.items():
+        expected = dict(health.run_query(f"SELECT {bucket.format(row='')}, COUNT(*) FROM {table} "
+                                         f"GROUP BY {bucket.format(row='')}"))
+        actual = dict(health.run_query("SELECT Bucket, Value FROM Counters WHERE Name = ? AND Value != 0", (name,)))
+        assert actual == expected, name
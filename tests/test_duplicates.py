@@ -0,0 +1,34 @@
+# Duplicate patients: candidates found by blocking keys, and merges that move
+# every reference and the rollups over to the kept record
+
+
+def add_patient(health, name, age, gender, phone=None, address=None):
+    return health.insert_row("Patients", {"Name": name, "Age": age, "Gender": gender, "Phone": phone,
+                                          "Address": address, "NameKey": health.name_key(name),
+                                          "PhoneKey": health.phone_key(phone)})
+
+
+def test_same_phone_is_found_in_a_large_name_block(health):
+    with health.transaction() as conn:
+        conn.executemany("INSERT INTO Patients (Name, Age, Gender, Phone, NameKey, PhoneKey) VALUES (?, ?, ?, ?, ?, ?)",
+                         [("Priya Sharma", 20 + n % 40, "Female", f"9000{n:06d}", health.name_key("Priya Sharma"),
+                           health.phone_key(f"9000{n:06d}")) for n in range(health.CANDIDATE_LIMIT + 10)])
+    same = add_patient(health, "Priya Sharma", 52, "Female", "98450 12345")
+    candidates = health.possible_duplicates("Priya Sharma", 52, "Female", "+91 98450 12345")
+    assert candidates[0][0] == same
+    assert len(candidates) <= 2 * health.CANDIDATE_LIMIT
+
+
+def test_possible_duplicates_and_merge(health, doctor, calorie_rollup):
+    keep = add_patient(health, "Meera Kurien", 52, "Female", "98450 54321")
+    duplicate = add_patient(health, "Mira Kurien", 52, "Female", address="12 Main Road")
+    assert keep in [candidate[0] for candidate in health.possible_duplicates("Meera Kurian", 52, "Female", "")]
+    health.insert_row("Calories", {"PatientID": duplicate, "DoctorID": doctor, "TotalCalories": 900,
+                                   "Date": "2024-03-01"})
+    patients = health.dashboard_counters.__wrapped__("")["patients"][""]
+    moved = health.merge_patients(keep, duplicate)
+    assert moved["Calories"] == 1
+    assert calorie_rollup(keep) == [("2024-03-01", 900, 1)]
+    assert calorie_rollup(duplicate) == []
+    assert health.run_query("SELECT Address FROM Patients WHERE PatientID = ?", (keep,)) == [("12 Main Road",)]
+    assert health.dashboard_counters.__wrapped__("")["patients"][""] == patients - 1
@@ -0,0 +1,25 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Exports are streamed batch by batch; a column's Parquet type must fit every batch
+
+
+def test_parquet_types_fit_every_batch(health, tmp_path):
+    path = str(tmp_path / "mixed.parquet")
+    batches = [
+        [(None, 1, None), (None, 2, None)],
+        [(3, 2.5, None), (4, "x", None)],
+        [(5, 7, None)],
+    ]
+    health.write_parquet(iter(batches), ["Late", "Mixed", "Empty"], path)
+    parquet = pq.ParquetFile(path)
+    assert parquet.schema_arrow == pa.schema([("Late", pa.int64()), ("Mixed", pa.string()), ("Empty", pa.string())])
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.read().to_pydict() == {"Late": [None, None, 3, 4, 5], "Mixed": ["1", "2", "2.5", "x", "7"],
+                                          "Empty": [None] * 5}
+
+
+def test_integers_then_floats_become_floats(health, tmp_path):
+    path = str(tmp_path / "numbers.parquet")
+    health.write_parquet(iter([[(1,)], [(2.5,)]]), ["Value"], path)
+    assert pq.read_table(path).to_pydict() == {"Value": [1.0, 2.5]}
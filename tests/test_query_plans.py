@@ -0,0 +1,101 @@
+import datetime
+import sqlite3
+
+import pytest
+
+
+def plan(health, sql, params=()):
+    return health.explain_query(sql, params)
+
+
+# The SQL a helper sends through run_query, without running it
+def captured_queries(health, monkeypatch, func, *args, **kwargs):
+    queries = []
+    monkeypatch.setattr(health, "run_query", lambda sql, params=(), archives=None: queries.append((sql, params)) or [])
+    func(*args, **kwargs)
+    return queries
+
+
+def test_migrations_run_once_and_are_idempotent(health, tmp_path):
+    conn = sqlite3.connect(tmp_path / "fresh.db", isolation_level=None)
+    assert health.migrate(conn) == len(health.MIGRATIONS)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(health.MIGRATIONS)
+    assert health.migrate(conn) == len(health.MIGRATIONS)
+
+
+@pytest.mark.parametrize("table, column", [
+    ("Appointments", "PatientID"), ("Appointments", "DoctorID"), ("HealthyDiets", "PatientID"),
+    ("HealthyDiets", "DoctorID"), ("Calories", "PatientID"), ("Calories", "DoctorID"), ("Calories", "Date"),
+    ("Symptoms", "PatientID"), ("Diagnosis", "PatientID"), ("PhysicalFitness", "PatientID"),
+    ("Prescription", "PatientID"), ("Prescription", "DoctorID"), ("Dispensary", "PatientID"),
+    ("Dispensary", "DoctorID"), ("Dispensary", "PrescriptionID"), ("Billing", "PatientID"),
+    ("LabTests", "CompounderID"), ("LabTests", "DateOfTest"),
+])
+def test_foreign_key_and_date_columns_are_indexed(health, table, column):
+    steps = plan(health, f"SELECT * FROM {table} WHERE {column} = ?", (1,))
+    assert any(step.startswith(f"SEARCH {table} USING") and f"({column}=?" in step for step in steps), steps
+
+
+def test_patient_calories_in_date_range_use_covering_index(health):
+    steps = plan(health, "SELECT Date, TotalCalories FROM Calories WHERE PatientID = ? AND Date BETWEEN ? AND ?",
+                 (1, "2024-01-01", "2024-01-31"))
+    assert steps == ["SEARCH Calories USING COVERING INDEX idx_calories_patient_date "
+                     "(PatientID=? AND Date>? AND Date<?)"]
+
+
+def test_timeline_seeks_every_table_by_patient(health, monkeypatch):
+    (sql, params), = captured_queries(health, monkeypatch, health.fetch_timeline, 1)
+    steps = plan(health, sql, params)
+    for _, table, _, _, _ in health.TIMELINE_SOURCES:
+        assert any(step.startswith(f"SEARCH {table} USING") and "(PatientID=?" in step for step in steps), table
+    # Only the merged branches are scanned (in order), never a table
+    assert all("subquery" in step for step in steps if step.startswith("SCAN")), steps
+
+
+def test_view_pages_seek_the_key(health, monkeypatch):
+    for name in health.VIEWS:
+        (sql, params), = captured_queries(health, monkeypatch, health.fetch_page, name, after=(10, 10))
+        steps = plan(health, sql, params)
+        assert "USE TEMP B-TREE FOR ORDER BY" not in steps, (name, steps)
+        assert steps[0].startswith("SEARCH"), (name, steps)
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_sorted_page_uses_the_sort_column_index(health, monkeypatch, descending):
+    # A short page goes on to the NULL range; the first query is the page itself
+    (sql, params), *_ = captured_queries(health, monkeypatch, health.fetch_page, "Calories",
+                                         after=("2024-01-01", 5), sort="Date", descending=descending)
+    steps = plan(health, sql, params)
+    assert steps[0].startswith("SEARCH Calories USING INDEX idx_calories_date"), steps
+    assert "USE TEMP B-TREE FOR ORDER BY" not in steps
+
+
+def test_appointment_conflict_is_a_range_seek(health):
+    sql = "EXPLAIN QUERY PLAN SELECT AppointmentID FROM Appointments WHERE DoctorID = ? AND StartsAt > ? " \
+          "AND StartsAt < ? AND EndsAt > ? AND Status = 'Scheduled' AND AppointmentID != ? LIMIT 1"
+    with health.get_pool().connection() as conn:
+        steps = [row[3] for row in conn.execute(sql, (1, "a", "b", "c", 0))]
+    assert steps == ["SEARCH Appointments USING COVERING INDEX idx_appointments_doctor_starts "
+                     "(DoctorID=? AND StartsAt>? AND StartsAt<?)"]
+
+
+def test_duplicate_candidates_use_the_blocking_key_indexes(health, monkeypatch):
+    (sql, params), = captured_queries(health, monkeypatch, health.possible_duplicates,
+                                      "Ana Roy", 30, "Female", "98765 43210")
+    steps = plan(health, sql, params)
+    assert any("idx_patients_namekey" in step for step in steps), steps
+    assert any("idx_patients_phonekey" in step for step in steps), steps
+
+
+def test_dashboard_reads_counters_by_key(health, monkeypatch):
+    (sql, params), = captured_queries(health, monkeypatch, health.dashboard_counters.__wrapped__,
+                                      datetime.date.today().isoformat())
+    steps = plan(health, sql, params)
+    assert all(step.startswith("SEARCH Counters USING PRIMARY KEY") or step.startswith("MULTI-INDEX OR")
+               or step.startswith("INDEX") for step in steps), steps
+
+
+def test_note_search_uses_the_full_text_index(health, monkeypatch):
+    (sql, params), = captured_queries(health, monkeypatch, health.search_notes, "asthma")
+    steps = plan(health, sql, params)
+    assert steps[0].startswith("SCAN NotesSearch VIRTUAL TABLE INDEX"), steps
@@ -0,0 +1,15 @@
+# The notes search index is kept in step with its source tables by triggers
+
+
+def test_search_index_follows_inserts_updates_and_deletes(health, patient):
+    symptom_id = health.insert_row("Symptoms", {"PatientID": patient, "Symptoms": "wheezing at night",
+                                                "Duration": "3 days", "Allergy": "none"})
+    results, _ = health.search_notes("wheezing")
+    assert [(table, record) for table, record, *_ in results] == [("Symptoms", symptom_id)]
+    with health.transaction() as conn:
+        conn.execute("UPDATE Symptoms SET Symptoms = 'hoarse voice' WHERE SymptomID = ?", (symptom_id,))
+    assert health.search_notes("wheezing")[0] == []
+    assert len(health.search_notes("hoarse")[0]) == 1
+    with health.transaction() as conn:
+        conn.execute("DELETE FROM Symptoms WHERE SymptomID = ?", (symptom_id,))
+    assert health.search_notes("hoarse")[0] == []
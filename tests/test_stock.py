@@ -0,0 +1,17 @@
+# Stock on hand follows the stock ledger: receipts, counts and dispenses
+
+
+def test_stock_on_hand_follows_receipts_and_dispenses(health, patient, doctor):
+    medicine = f"testmedicine{patient}"
+    health.record_stock(medicine, 10, "receipt", reorder_level=5)
+    prescription = health.insert_row("Prescription", {"PatientID": patient, "DoctorID": doctor,
+                                                      "MedicineName": medicine})
+    dispense = health.insert_row("Dispensary", {"PatientID": patient, "DoctorID": doctor,
+                                                "PrescriptionID": prescription, "Medicine": medicine, "Quantity": 6})
+    assert health.stock_level(medicine) == (4, 5)
+    assert (medicine, 4, 5) in health.low_stock()
+    with health.transaction() as conn:
+        conn.execute("DELETE FROM Dispensary WHERE DispensaryID = ?", (dispense,))
+    assert health.stock_level(medicine) == (10, 5)
+    assert health.record_stock(medicine, 8, "count") == -2
+    assert health.stock_level(medicine) == (8, 5)